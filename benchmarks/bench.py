@@ -0,0 +1,273 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "data", "SQLite"), os.path.join(ROOT, "learning")]
+
+import numpy as np
+import pandas as pd
+import xgboost
+from profiling import peak_rss_kb, reset_peak_rss, rss_kb
+from synthetic import generate_history
+
+RESULTS_FILE = "benchmarks/results.json"
+BASELINE_FILE = "benchmarks/baseline.json"
+
+# (matches, players) of each run; "1000000:50000" is the scale of a multi-tour history
+DEFAULT_SIZES = [(20000, 2000), (100000, 10000)]
+
+STAGES = ["players_informations", "import_matches", "player_stats", "train", "score_batch", "score_single"]
+
+# Fixtures of the inference stages: one slate scored at once, and single add_matches calls
+BATCH_FIXTURES = 2000
+SINGLE_FIXTURES = 200
+
+# A stage regresses when it is slower (or needs more memory) than the baseline by more than
+# the tolerance and by more than these absolute margins, which absorb timer and allocator noise
+MIN_SECONDS = 0.05
+MIN_MEMORY_MB = 16
+
+
+def _fixtures(n, seed):
+    """n random fixtures between players having a stats row, with random match context."""
+    import sqlite3
+    from next import CONTEXT_COLUMNS, STATS_TABLE
+
+    conn = sqlite3.connect("data/SQLite/tennis.db", timeout=60)
+    ids = np.array([row[0] for row in conn.execute(f"SELECT player_id FROM '{STATS_TABLE}'")])
+    conn.close()
+    rng = np.random.default_rng(seed)
+    fixtures = pd.DataFrame(rng.normal(0, 10, (n, len(CONTEXT_COLUMNS))), columns=CONTEXT_COLUMNS)
+    fixtures.insert(0, "PLAYER_1", rng.choice(ids, n))
+    fixtures.insert(1, "PLAYER_2", rng.choice(ids, n))
+    return fixtures
+
+
+def _stage_players_informations(seed):
+    from players_informations import create_players_table
+    return create_players_table, None
+
+
+def _stage_import_matches(seed):
+    from matches_data import import_atp_data_to_sqlite
+    return import_atp_data_to_sqlite, None
+
+
+def _stage_player_stats(seed):
+    from players import compute_final_player_stats, load_and_clean_atp_matches, player_ids_from_sqlite
+    from storage import write_table
+    from tours import tour_config
+
+    df = load_and_clean_atp_matches()
+    player_ids = player_ids_from_sqlite("data/SQLite/tennis.db")
+
+    def run():
+        stats = compute_final_player_stats(df, player_ids)
+        write_table("data/SQLite/tennis.db", tour_config("wta")["players_stats"], stats, indexes=["player_id"])
+    return run, len(df)
+
+
+def _stage_train(seed):
+    from main import XGB_PARAMS, load_training_matrix, orient_matches, train_model
+    from model_store import save_model
+
+    values, _, feature_columns = load_training_matrix()
+
+    def run():
+        X, y, groups = orient_matches(values, feature_columns, seed=seed)
+        model, train_accuracy, test_accuracy = train_model(X, y, groups, seed=seed)
+        save_model(model, feature_columns, params=XGB_PARAMS, n_matches=len(values),
+                   metrics={"train_accuracy": train_accuracy, "test_accuracy": test_accuracy})
+    return run, len(values)
+
+
+def _stage_score_batch(seed):
+    from model_store import load_model
+    from next import build_feature_rows, player_cache
+
+    model, manifest = load_model()
+    fixtures = _fixtures(BATCH_FIXTURES, seed)
+
+    def run():
+        rows = build_feature_rows(fixtures, cache=player_cache())
+        model.predict_proba(rows[manifest["feature_columns"]].to_numpy(dtype="float32"))
+    return run, BATCH_FIXTURES
+
+
+def _stage_score_single(seed):
+    from next import CONTEXT_COLUMNS, add_matches
+
+    fixtures = _fixtures(SINGLE_FIXTURES, seed)
+    columns = ["PLAYER_1", "PLAYER_2", "ATP_POINT_DIFF", "ATP_RANK_DIFF", "BEST_OF", "DRAW_SIZE",
+               "AGE_DIFF", "HEIGHT_DIFF", "H2H_DIFF", "H2H_SURFACE_DIFF"]
+    assert set(columns[2:]) == set(CONTEXT_COLUMNS)
+
+    def run():
+        for fixture in fixtures[columns].itertuples(index=False):
+            add_matches(*fixture)
+    return run, SINGLE_FIXTURES
+
+
+def _run_stage(stage, work_dir, seed):
+    """Runs one stage in work_dir (in its own process) and measures it past its setup."""
+    os.chdir(work_dir)
+    run, rows = globals()["_stage_" + stage](seed)
+    gc.collect()
+    rss_before = rss_kb()
+    peak_reset = reset_peak_rss()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    peak = peak_rss_kb()
+    result = {"stage": stage, "seconds": round(seconds, 4), "rows": rows,
+              "peak_rss_mb": round(peak / 1024, 1)}
+    if rss_before is not None and peak_reset:
+        result["peak_delta_mb"] = round((peak - rss_before) / 1024, 1)
+    return result
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=STAGES, work_dir=None, seed=0, keep=False):
+    """
+    Runs the pipeline stages on synthetic histories of the given sizes.
+
+    For each (matches, players) size, a seeded history is generated in a scratch copy of the
+    repo layout (data/CSV/WTA/, data/SQLite/tennis.db, learning/models/) and the stages run
+    there in order, each through its usual entry point and each in a fresh process: its
+    time and peak memory exclude the interpreter, the imports and the loading of its inputs.
+
+    :return: List of result dicts (stage, n_matches, n_players, seconds, rows, peak_rss_mb and,
+             on Linux, peak_delta_mb: the peak memory above the RSS at the start of the stage).
+    """
+    own_dir = work_dir is None
+    if own_dir:
+        work_dir = tempfile.mkdtemp(prefix="tennis-bench-")
+    results = []
+    context = multiprocessing.get_context("spawn")
+    try:
+        for n_matches, n_players in sizes:
+            size_dir = os.path.join(work_dir, f"{n_matches}-{n_players}")
+            for sub_dir in ("data/CSV/WTA", "data/SQLite", "learning"):
+                os.makedirs(os.path.join(size_dir, sub_dir), exist_ok=True)
+            start = time.perf_counter()
+            generate_history(os.path.join(size_dir, "data/CSV/WTA"), n_matches, n_players, seed=seed)
+            print(f"{n_matches} matches, {n_players} players: generated in {time.perf_counter() - start:.1f}s")
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(_run_stage, stage, size_dir, seed).result()
+                result.update(n_matches=n_matches, n_players=n_players)
+                results.append(result)
+                print(f"  {stage:<22}{result['seconds']:>10.3f}s{result['peak_rss_mb']:>10.1f} MB peak")
+            if not keep:
+                shutil.rmtree(size_dir, ignore_errors=True)
+    finally:
+        if own_dir and not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "xgboost": xgboost.__version__,
+    }
+
+
+def scaling(results):
+    """
+    Exponent k of seconds ~ n_matches ** k of each stage, fitted on the sizes it ran at
+    (1 is linear). Stages measured at a single size are left out.
+    """
+    exponents = {}
+    for stage in dict.fromkeys(result["stage"] for result in results):
+        points = [(result["n_matches"], result["seconds"]) for result in results
+                  if result["stage"] == stage and result["seconds"] > 0]
+        if len({n for n, _ in points}) > 1:
+            n, seconds = np.log(np.array(points, dtype=float)).T
+            exponents[stage] = round(float(np.polyfit(n, seconds, 1)[0]), 2)
+    return exponents
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares results with a baseline's results, stage by stage and size by size.
+
+    :return: List of regression messages, empty when nothing regressed.
+    """
+    reference = {(r["stage"], r["n_matches"], r["n_players"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = reference.get((result["stage"], result["n_matches"], result["n_players"]))
+        if base is None:
+            continue
+        label = f"{result['stage']} at {result['n_matches']} matches"
+        if (result["seconds"] > base["seconds"] * (1 + tolerance)
+                and result["seconds"] - base["seconds"] > MIN_SECONDS):
+            regressions.append(f"{label}: {base['seconds']:.3f}s -> {result['seconds']:.3f}s")
+        if "peak_delta_mb" in result and "peak_delta_mb" in base:
+            if (result["peak_delta_mb"] > base["peak_delta_mb"] * (1 + tolerance)
+                    and result["peak_delta_mb"] - base["peak_delta_mb"] > MIN_MEMORY_MB):
+                regressions.append(f"{label}: {base['peak_delta_mb']:.1f} MB -> {result['peak_delta_mb']:.1f} MB")
+    return regressions
+
+
+def parse_sizes(text):
+    """'20000:2000,1000000:50000' -> [(20000, 2000), (1000000, 50000)]"""
+    return [tuple(int(value) for value in size.split(":")) for size in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the pipeline stages on synthetic match histories.")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES,
+                        help="matches:players pairs, e.g. 20000:2000,1000000:50000")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ", ".join(STAGES))
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--work-dir", help="where the synthetic histories are built (a temporary directory by default)")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic histories and databases")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stages = args.stages.split(",")
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error("unknown stages: " + ", ".join(sorted(unknown)))
+    results = run_benchmarks(args.sizes, stages, args.work_dir, args.seed, args.keep)
+    report = {"environment": environment(), "scaling": scaling(results), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Scaling exponents (seconds ~ matches^k):", report["scaling"])
+
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print("Baseline saved to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print("No regression against", args.baseline)
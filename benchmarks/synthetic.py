@@ -0,0 +1,165 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Columns of the yearly match CSVs ('<tour>_matches_YYYY.csv'), in file order
+MATCH_COLUMNS = [
+    "tourney_id", "tourney_name", "surface", "draw_size", "tourney_level", "tourney_date", "match_num",
+    "winner_id", "winner_seed", "winner_entry", "winner_name", "winner_hand", "winner_ht", "winner_ioc",
+    "winner_age", "loser_id", "loser_seed", "loser_entry", "loser_name", "loser_hand", "loser_ht",
+    "loser_ioc", "loser_age", "score", "best_of", "round", "minutes",
+    "w_ace", "w_df", "w_svpt", "w_1stIn", "w_1stWon", "w_2ndWon", "w_SvGms", "w_bpSaved", "w_bpFaced",
+    "l_ace", "l_df", "l_svpt", "l_1stIn", "l_1stWon", "l_2ndWon", "l_SvGms", "l_bpSaved", "l_bpFaced",
+    "winner_rank", "winner_rank_points", "loser_rank", "loser_rank_points",
+]
+PLAYER_COLUMNS = ["player_id", "name_first", "name_last", "hand", "dob", "ioc", "height", "wikidata_id"]
+
+SURFACES = (["Hard", "Clay", "Grass", "Carpet"], [0.58, 0.28, 0.11, 0.03])
+DRAW_SIZES = ([32, 64, 128, 96, 28, 56], [0.45, 0.15, 0.2, 0.1, 0.05, 0.05])
+LEVELS = ["G", "PM", "P", "I", "D", "F"]
+IOCS = ["USA", "FRA", "ESP", "ITA", "GER", "RUS", "CZE", "AUS", "GBR", "ARG", "JPN", "CHN", "POL", "CAN", "BRA"]
+
+# Share of the matches without serve statistics, and of the players without a known height,
+# close to the real files (both make import_atp_data_to_sqlite drop the match)
+MISSING_STATS = 0.085
+MISSING_HEIGHT = 0.15
+MISSING_RANK = 0.01
+
+# Matches per tournament: tournaments are weekly and ordered by date within a year
+MATCHES_PER_TOURNAMENT = 60
+
+
+def generate_players(n_players, seed=0, first_id=200000):
+    """
+    Players of a synthetic tour, in the '<tour>_players.csv' schema, with their hidden skill.
+
+    :return: Tuple (players, skill): the players DataFrame and a float array of skills.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(first_id, first_id + n_players)
+    height = np.round(rng.normal(174, 7, n_players)).astype(float)
+    height[rng.random(n_players) < MISSING_HEIGHT] = np.nan
+    dob = pd.to_datetime("1955-01-01") + pd.to_timedelta(rng.integers(0, 55 * 365, n_players), unit="D")
+    players = pd.DataFrame({
+        "player_id": ids,
+        "name_first": [f"First{i}" for i in range(n_players)],
+        "name_last": [f"Last{i}" for i in range(n_players)],
+        "hand": rng.choice(["R", "L", "U"], n_players, p=[0.8, 0.12, 0.08]),
+        "dob": dob.strftime("%Y%m%d").astype(int),
+        "ioc": rng.choice(IOCS, n_players),
+        "height": pd.array(height, dtype="Int64"),
+        "wikidata_id": "",
+    })
+    return players, rng.normal(0, 1, n_players)
+
+
+def generate_year(year, n_matches, players, skill, rng, best_of=3):
+    """
+    One synthetic yearly match file (DataFrame in the MATCH_COLUMNS order).
+
+    Players are drawn among those old enough and not retired, the better ones more often; the
+    winner follows a logistic model of the skill difference, and ranks and points follow the
+    skill. Serve statistics are drawn per match and kept consistent with each other
+    (1stIn <= svpt, bpSaved <= bpFaced...), with the shares of missing values of the real files.
+    """
+    ids = players["player_id"].to_numpy()
+    birth_year = players["dob"].to_numpy() // 10000
+    active = np.flatnonzero((year - birth_year >= 16) & (year - birth_year <= 36))
+    if len(active) < 2:
+        active = np.arange(len(ids))
+    weight = np.exp(skill[active])
+    weight /= weight.sum()
+
+    n_tournaments = max(1, -(-n_matches // MATCHES_PER_TOURNAMENT))
+    tournament = np.sort(rng.integers(0, n_tournaments, n_matches))
+    starts = pd.Timestamp(year, 1, 1) + pd.to_timedelta(np.sort(rng.integers(0, 358, n_tournaments)), unit="D")
+    tourney_date = starts.strftime("%Y%m%d").astype(int).to_numpy()[tournament]
+    surface = rng.choice(SURFACES[0], n_tournaments, p=SURFACES[1])[tournament]
+    draw_size = rng.choice(DRAW_SIZES[0], n_tournaments, p=DRAW_SIZES[1])[tournament]
+    level = rng.choice(LEVELS, n_tournaments)[tournament]
+
+    p1 = rng.choice(active, n_matches, p=weight)
+    p2 = rng.choice(active, n_matches, p=weight)
+    same = p1 == p2
+    p2[same] = active[(np.searchsorted(active, p2[same]) + 1) % len(active)]
+    p1_wins = rng.random(n_matches) < 1 / (1 + np.exp(-(skill[p1] - skill[p2])))
+    w = np.where(p1_wins, p1, p2)
+    l = np.where(p1_wins, p2, p1)
+
+    rank_of = np.empty(len(ids))
+    rank_of[np.argsort(-(skill + rng.normal(0, 0.3, len(ids))))] = np.arange(1, len(ids) + 1)
+    dates = pd.to_datetime(tourney_date.astype(str), format="%Y%m%d")
+    dob = pd.to_datetime(players["dob"].astype(str), format="%Y%m%d").to_numpy()
+    height = players["height"].to_numpy(dtype="float64", na_value=np.nan)
+    name = (players["name_first"] + " " + players["name_last"]).to_numpy()
+
+    df = pd.DataFrame({
+        "tourney_id": [f"{year}-{t:04d}" for t in tournament],
+        "tourney_name": [f"Event {t}" for t in tournament],
+        "surface": surface,
+        "draw_size": draw_size,
+        "tourney_level": level,
+        "tourney_date": tourney_date,
+        "match_num": np.arange(n_matches) % MATCHES_PER_TOURNAMENT + 1,
+        "score": "6-4 6-4",
+        "best_of": best_of,
+        "round": "R32",
+        "minutes": rng.integers(50, 200, n_matches),
+    })
+    for side, pos in (("winner", w), ("loser", l)):
+        df[f"{side}_id"] = ids[pos]
+        df[f"{side}_seed"] = np.nan
+        df[f"{side}_entry"] = ""
+        df[f"{side}_name"] = name[pos]
+        df[f"{side}_hand"] = players["hand"].to_numpy()[pos]
+        df[f"{side}_ht"] = height[pos]
+        df[f"{side}_ioc"] = players["ioc"].to_numpy()[pos]
+        df[f"{side}_age"] = np.round((dates.to_numpy() - dob[pos]) / np.timedelta64(1, "D") / 365.25, 1)
+        df[f"{side}_rank"] = rank_of[pos]
+        df[f"{side}_rank_points"] = np.round(10000 * np.exp(-rank_of[pos] / 150))
+
+    for prefix, first_won in (("w", 0.68), ("l", 0.6)):
+        svpt = rng.integers(40, 110, n_matches)
+        first_in = rng.binomial(svpt, 0.62)
+        double_faults = rng.binomial(svpt - first_in, 0.08)
+        bp_faced = rng.binomial(svpt, 0.08 if prefix == "w" else 0.14)
+        df[f"{prefix}_ace"] = rng.binomial(first_in, 0.06)
+        df[f"{prefix}_df"] = double_faults
+        df[f"{prefix}_svpt"] = svpt
+        df[f"{prefix}_1stIn"] = first_in
+        df[f"{prefix}_1stWon"] = rng.binomial(first_in, first_won)
+        df[f"{prefix}_2ndWon"] = rng.binomial(svpt - first_in - double_faults, first_won - 0.2)
+        df[f"{prefix}_SvGms"] = np.maximum(1, svpt // 6)
+        df[f"{prefix}_bpSaved"] = rng.binomial(bp_faced, 0.6)
+        df[f"{prefix}_bpFaced"] = bp_faced
+
+    stats_columns = [col for col in MATCH_COLUMNS if col[:2] in ("w_", "l_")]
+    df[stats_columns] = df[stats_columns].astype("float64")
+    df.loc[rng.random(n_matches) < MISSING_STATS, stats_columns] = np.nan
+    for side in ("winner", "loser"):
+        df.loc[rng.random(n_matches) < MISSING_RANK, [f"{side}_rank", f"{side}_rank_points"]] = np.nan
+    return df[MATCH_COLUMNS]
+
+
+def generate_history(out_dir, n_matches, n_players, start_year=1991, end_year=2024, tour="wta", seed=0):
+    """
+    Writes a seeded synthetic match history in the layout of data/CSV/<TOUR>/: one
+    '<tour>_matches_YYYY.csv' per year from start_year to end_year (n_matches in all, more in
+    the later years as in the real files) and '<tour>_players.csv'. The same arguments always
+    give the same files.
+
+    :return: Number of matches written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    players, skill = generate_players(n_players, seed)
+    players.to_csv(os.path.join(out_dir, f"{tour}_players.csv"), index=False)
+
+    years = np.arange(start_year, end_year + 1)
+    share = np.linspace(1, 2, len(years))
+    per_year = np.floor(n_matches * share / share.sum()).astype(int)
+    per_year[-1] += n_matches - per_year.sum()
+    rng = np.random.default_rng(seed + 1)
+    for year, count in zip(years, per_year):
+        df = generate_year(int(year), int(count), players, skill, rng, best_of=3 if tour == "wta" else 5)
+        df.to_csv(os.path.join(out_dir, f"{tour}_matches_{year}.csv"), index=False)
+    return int(per_year.sum())
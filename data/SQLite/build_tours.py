@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from matches_data import import_atp_data_to_sqlite
+from players import build_player_stats
+from players_informations import create_players_table
+import profiling
+
+def build_tour(tour, db_path, pool):
+    """
+    Builds every table of one tour: players informations, matches and players stats.
+    The feature families and the players stats run on the given process pool.
+    Its stages are recorded under the tour's name ('wta/features'...).
+    """
+    with profiling.stage(tour):
+        with profiling.stage("players_informations"):
+            create_players_table(db_file=db_path, tour=tour)
+        import_atp_data_to_sqlite(db_path, tour=tour, pool=pool)
+        with profiling.stage("players_stats"):
+            pool.submit(build_player_stats, db_path, tour).result()
+
+def build_tours(tours=("atp", "wta"), db_path="data/SQLite/tennis.db", workers=None):
+    """
+    Builds the tables of several tours concurrently in one run.
+
+    Each tour is driven from its own thread while the CPU-bound work of every tour is
+    submitted to one shared process pool, so the cores stay busy while one tour is
+    reading its files or writing to SQLite. Both tours also share the match CSV cache.
+
+    The pool starts its workers with the spawn method: forked workers would inherit the
+    SQLite connections (and WAL state) the other tour's thread has open at that moment.
+
+    :param tours: Tours to build ('atp', 'wta').
+    :param db_path: SQLite database receiving the tables.
+    :param workers: Size of the shared process pool (defaults to the number of CPUs).
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        with ThreadPoolExecutor(max_workers=len(tours)) as threads:
+            futures = [threads.submit(build_tour, tour, db_path, pool) for tour in tours]
+            for future in futures:
+                future.result()
+
+if __name__ == "__main__":
+    with profiling.session("build_tours"):
+        build_tours()
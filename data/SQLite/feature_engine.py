@@ -0,0 +1,390 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from rolling import RollingSlope, RollingWindows
+
+# Window sizes and metrics used by the matches table
+WIN_WINDOWS = [3, 5, 10, 25, 50, 100]
+SERVE_WINDOWS = [3, 5, 10, 20, 50, 100, 200, 300, 2000]
+SERVE_METRICS = [
+    ("P_ACE", "p_ace"),
+    ("P_DF", "p_df"),
+    ("P_1ST_IN", "p_1stIn"),
+    ("P_1ST_WON", "p_1stWon"),
+    ("P_2ND_WON", "p_2ndWon"),
+    ("P_BP_SAVED", "p_bpSaved"),
+]
+ELO_GRAD_WINDOWS = [5, 10, 20, 35, 50, 100, 250]
+ELO_K = 24
+ELO_INIT = 1500
+
+# Feature families computed by the engine and their window sizes (None for families without windows)
+FAMILIES = {
+    "h2h": None,
+    "n_games": None,
+    "win": WIN_WINDOWS,
+    "serve": SERVE_WINDOWS,
+    "elo": None,
+    "elo_grad": ELO_GRAD_WINDOWS,
+}
+
+CHECKPOINT_VERSION = 3
+
+# Columns of the cleaned match frame read by the engine
+STREAM_COLUMNS = [
+    "winner_id", "loser_id", "surface",
+    "w_ace", "w_df", "w_svpt", "w_1stIn", "w_1stWon", "w_2ndWon", "w_bpSaved", "w_bpFaced",
+    "l_ace", "l_df", "l_svpt", "l_1stIn", "l_1stWon", "l_2ndWon", "l_bpSaved", "l_bpFaced",
+]
+
+
+def feature_columns(families=None):
+    """
+    Returns the names of the columns produced for the given families (all of them
+    by default), in the order they are stored in the matches table.
+    """
+    if families is None:
+        families = FAMILIES
+    cols = []
+    if "h2h" in families:
+        cols += ["H2H_DIFF", "H2H_SURFACE_DIFF"]
+    if "n_games" in families:
+        cols += ["DIFF_N_GAMES"]
+    for k in families.get("win") or []:
+        cols += ["WIN_LAST_" + str(k) + "_DIFF"]
+    for k in families.get("serve") or []:
+        cols += [prefix + "_LAST_" + str(k) + "_DIFF" for prefix, _ in SERVE_METRICS]
+    if "elo" in families:
+        cols += ["ELO_DIFF", "ELO_SURFACE_DIFF"]
+    for n in families.get("elo_grad") or []:
+        cols += ["ELO_GRAD_" + str(n) + "_DIFF"]
+    return cols
+
+
+def player_stats_columns():
+    """
+    Returns the columns of the players stats table ('players(w)_stats'), as read by
+    learning/next.py::build_feature_rows.
+    """
+    cols = ["player_id", "n_games"]
+    cols += ["win_last_" + str(k) for k in WIN_WINDOWS]
+    for k in SERVE_WINDOWS:
+        cols += [metric + "_last_" + str(k) for _, metric in SERVE_METRICS]
+    cols += ["final_elo", "elo_hard", "elo_clay", "elo_grass"]
+    cols += ["elo_grad_last_" + str(n) for n in ELO_GRAD_WINDOWS]
+    return cols
+
+
+def elo_update(elo_w, elo_l, k=ELO_K):
+    """
+    Applies one Elo update for a match won by the player rated elo_w
+    and returns the new (winner, loser) ratings.
+    """
+    exp_w = 1/(1+10**((elo_l-elo_w)/400))
+    exp_l = 1/(1+10**((elo_w-elo_l)/400))
+
+    elo_w += k*(1-exp_w)
+    elo_l += k*(0-exp_l)
+    return elo_w, elo_l
+
+
+def serve_metrics(ace, df, svpt, first_in, first_won, second_won, bp_saved, bp_faced):
+    """
+    Computes the serve percentages of one player in one match.
+    Metrics that cannot be computed (zero denominator) are left out of the returned dict.
+    """
+    metrics = {}
+    if (svpt != 0) and (svpt != first_in):
+        # Percentatge of aces
+        metrics["p_ace"] = 100*(ace/svpt)
+        # Percentatge of double faults
+        metrics["p_df"] = 100*(df/svpt)
+        # Percentatge of first serve in
+        metrics["p_1stIn"] = 100*(first_in/svpt)
+        # Percentatge of second serve won
+        metrics["p_2ndWon"] = 100*(second_won/(svpt-first_in))
+    # Percentatge of first serve won
+    if first_in != 0:
+        metrics["p_1stWon"] = 100*(first_won/first_in)
+    # Percentatge of break points saved
+    if bp_faced != 0:
+        metrics["p_bpSaved"] = 100*(bp_saved/bp_faced)
+    return metrics
+
+
+class PlayerStore:
+    """
+    Dense per-player state. Each player id is mapped once to an integer index;
+    match counts, overall Elo and surface Elo live in NumPy arrays indexed by it,
+    and the rolling windows live in lists indexed the same way. Windows are only
+    allocated for the window sizes given (None when a family is not computed).
+    """
+
+    def __init__(self, win_windows=WIN_WINDOWS, serve_windows=SERVE_WINDOWS,
+                 grad_windows=ELO_GRAD_WINDOWS, capacity=1024):
+        self.win_windows = win_windows
+        self.serve_windows = serve_windows
+        self.grad_windows = grad_windows
+        self.index = {}
+        self.ids = []
+        self.surfaces = {}
+        self.n_games = np.zeros(capacity, dtype=np.int64)
+        self.elo = np.full(capacity, ELO_INIT, dtype=np.float64)
+        self.elo_surface = np.full((capacity, 0), ELO_INIT, dtype=np.float64)
+        self.results = []
+        self.serve = []
+        self.elo_trend = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _grow(self):
+        capacity = 2 * len(self.n_games)
+        n = len(self.ids)
+        n_games = np.zeros(capacity, dtype=np.int64)
+        n_games[:n] = self.n_games[:n]
+        elo = np.full(capacity, ELO_INIT, dtype=np.float64)
+        elo[:n] = self.elo[:n]
+        elo_surface = np.full((capacity, self.elo_surface.shape[1]), ELO_INIT, dtype=np.float64)
+        elo_surface[:n] = self.elo_surface[:n]
+        self.n_games, self.elo, self.elo_surface = n_games, elo, elo_surface
+
+    def player(self, pid):
+        """Returns the dense index of a player, registering it on first sight."""
+        idx = self.index.get(pid)
+        if idx is None:
+            idx = len(self.ids)
+            if idx == len(self.n_games):
+                self._grow()
+            self.index[pid] = idx
+            self.ids.append(pid)
+            if self.win_windows:
+                self.results.append(RollingWindows(self.win_windows, "b"))
+            if self.serve_windows:
+                self.serve.append([RollingWindows(self.serve_windows) for _ in SERVE_METRICS])
+            if self.grad_windows:
+                self.elo_trend.append(RollingSlope(self.grad_windows, origin=ELO_INIT))
+        return idx
+
+    def surface(self, surface):
+        """Returns the column of a surface in elo_surface, adding it on first sight."""
+        s = self.surfaces.get(surface)
+        if s is None:
+            s = len(self.surfaces)
+            self.surfaces[surface] = s
+            column = np.full((len(self.elo_surface), 1), ELO_INIT, dtype=np.float64)
+            self.elo_surface = np.hstack([self.elo_surface, column])
+        return s
+
+
+class FeatureEngine:
+    """
+    Replays the match stream once and computes every pre-match feature family
+    (H2H, match counts, win windows, serve windows, Elo and Elo gradients)
+    from a single per-player state.
+
+    :param families: Subset of FAMILIES to compute, mapping each family to its window
+                     sizes. Defaults to every family with its default windows.
+    """
+
+    def __init__(self, families=None):
+        self.families = dict(FAMILIES) if families is None else dict(families)
+        self.store = PlayerStore(self.families.get("win"), self.families.get("serve"),
+                                 self.families.get("elo_grad"))
+        # H2H counters keyed by packed (surface, winner index, loser index)
+        self.h2h = {}
+        self.h2h_surface = {}
+        self.columns = {col: [] for col in feature_columns(self.families)}
+
+    def __getstate__(self):
+        # Feature values of the last run are output, not state
+        state = self.__dict__.copy()
+        del state["columns"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.columns = {col: [] for col in feature_columns(self.families)}
+
+    def update(self, w_id, l_id, surface, w_stats, l_stats):
+        """
+        Records the features of one match (computed from the state before it)
+        and then updates the state of both players.
+
+        :param w_stats: Winner serve stats (ace, df, svpt, 1stIn, 1stWon, 2ndWon, bpSaved, bpFaced).
+        :param l_stats: Loser serve stats, same order.
+        """
+        cols = self.columns
+        families = self.families
+        store = self.store
+        w = store.player(w_id)
+        l = store.player(l_id)
+        s = store.surface(surface)
+
+        # H2H overall and on the match surface
+        if "h2h" in families:
+            pair_wl = (w << 32) | l
+            pair_lw = (l << 32) | w
+            wins = self.h2h.get(pair_wl, 0)
+            loses = self.h2h.get(pair_lw, 0)
+            wins_surface = self.h2h_surface.get((s << 64) | pair_wl, 0)
+            loses_surface = self.h2h_surface.get((s << 64) | pair_lw, 0)
+            cols["H2H_DIFF"].append(wins - loses)
+            cols["H2H_SURFACE_DIFF"].append(wins_surface - loses_surface)
+            self.h2h[pair_wl] = wins + 1
+            self.h2h_surface[(s << 64) | pair_wl] = wins_surface + 1
+
+        # Number of matches played
+        if "n_games" in families:
+            cols["DIFF_N_GAMES"].append(store.n_games.item(w) - store.n_games.item(l))
+        store.n_games[w] += 1
+        store.n_games[l] += 1
+
+        # Win rate over the last k matches
+        if store.win_windows:
+            results_w = store.results[w]
+            results_l = store.results[l]
+            for i, k in enumerate(store.win_windows):
+                if len(results_w) != 0 and len(results_l) != 0:
+                    wins_count_w = results_w.mean(i, 0)
+                    wins_count_l = results_l.mean(i, 0)
+                else:
+                    wins_count_w = 0
+                    wins_count_l = 0
+                cols["WIN_LAST_" + str(k) + "_DIFF"].append(wins_count_w-wins_count_l)
+            results_w.push(1)
+            results_l.push(0)
+
+        # Serve statistics over the last k matches
+        if store.serve_windows:
+            serve_w = store.serve[w]
+            serve_l = store.serve[l]
+            for i, k in enumerate(store.serve_windows):
+                for m, (prefix, _) in enumerate(SERVE_METRICS):
+                    cols[prefix + "_LAST_" + str(k) + "_DIFF"].append(
+                        serve_w[m].mean(i, 0.5) - serve_l[m].mean(i, 0.5)
+                    )
+            for serve, stats in ((serve_w, w_stats), (serve_l, l_stats)):
+                values = serve_metrics(*stats)
+                for m, (_, metric) in enumerate(SERVE_METRICS):
+                    if metric in values:
+                        serve[m].push(values[metric])
+
+        # Elo gradient over the last n matches (history before this match)
+        if store.grad_windows:
+            trend_w = store.elo_trend[w]
+            trend_l = store.elo_trend[l]
+            for i, n in enumerate(store.grad_windows):
+                if len(trend_w) >= n and len(trend_l) >= n:
+                    slope_w = trend_w.slope(i)
+                    slope_l = trend_l.slope(i)
+                    cols["ELO_GRAD_" + str(n) + "_DIFF"].append(slope_w-slope_l)
+                else:
+                    cols["ELO_GRAD_" + str(n) + "_DIFF"].append(0)
+
+        # Overall Elo (always kept, the gradients are computed from it)
+        elo_w, elo_l = elo_update(store.elo.item(w), store.elo.item(l))
+        store.elo[w] = elo_w
+        store.elo[l] = elo_l
+        if store.grad_windows:
+            trend_w.push(elo_w)
+            trend_l.push(elo_l)
+
+        # Elo on the match surface
+        if "elo" in families:
+            cols["ELO_DIFF"].append(elo_w-elo_l)
+            elo_w, elo_l = elo_update(store.elo_surface.item(w, s), store.elo_surface.item(l, s))
+            cols["ELO_SURFACE_DIFF"].append(elo_w-elo_l)
+            store.elo_surface[w, s] = elo_w
+            store.elo_surface[l, s] = elo_l
+
+    def player_snapshot(self, player_ids=None):
+        """
+        Dumps the current state of each player as the rows of the players stats table.
+
+        The values are those the engine would use for the player's next match: window
+        means with the same defaults as the matches table (0 for an empty win window,
+        0.5 for an empty serve window), Elo, surface Elo and the Elo slope over the last
+        n matches (0 with fewer than n). Players without any match get empty stats,
+        a 1500 Elo and zero slopes.
+
+        :param player_ids: Players to include (defaults to every player seen so far).
+        :return: DataFrame with player_stats_columns(), sorted by player_id.
+        """
+        if self.families != FAMILIES:
+            raise ValueError("player_snapshot needs an engine computing every feature family")
+        store = self.store
+        if player_ids is None:
+            player_ids = store.ids
+        rows = []
+        for pid in player_ids:
+            idx = store.index.get(pid)
+            if idx is None:
+                row = [pid] + [np.nan] * (1 + len(WIN_WINDOWS) + len(SERVE_WINDOWS) * len(SERVE_METRICS))
+                row += [ELO_INIT] * 4 + [0] * len(ELO_GRAD_WINDOWS)
+                rows.append(row)
+                continue
+            rows.append([pid] + self.player_state(idx))
+        snapshot = pd.DataFrame(rows, columns=player_stats_columns())
+        return snapshot.sort_values("player_id", kind="stable").reset_index(drop=True)
+
+    def player_state(self, idx):
+        """
+        Current state of the player stored at index idx, as the values of the players stats
+        columns after player_id (see player_snapshot).
+        """
+        store = self.store
+        row = [store.n_games.item(idx)]
+        row += [store.results[idx].mean(i, 0) for i in range(len(WIN_WINDOWS))]
+        serve = store.serve[idx]
+        for i in range(len(SERVE_WINDOWS)):
+            row += [serve[m].mean(i, 0.5) for m in range(len(SERVE_METRICS))]
+        row.append(store.elo.item(idx))
+        row += [ELO_INIT if s is None else store.elo_surface.item(idx, s)
+                for s in map(store.surfaces.get, ("Hard", "Clay", "Grass"))]
+        trend = store.elo_trend[idx]
+        row += [trend.slope(i) if len(trend) >= n else 0 for i, n in enumerate(ELO_GRAD_WINDOWS)]
+        return row
+
+    def run(self, df, progress=True):
+        """
+        Streams every row of the cleaned match frame through the engine.
+
+        :param df: DataFrame of matches in chronological order, or any mapping of
+                   STREAM_COLUMNS to array-likes.
+        :param progress: Show a tqdm progress bar.
+        :return: Dict mapping each feature column name to its list of values.
+        """
+        self.columns = {col: [] for col in feature_columns(self.families)}
+        values = [df[col].tolist() for col in STREAM_COLUMNS]
+        for row in tqdm(zip(*values), total=len(values[0]), disable=not progress):
+            self.update(row[0], row[1], row[2], row[3:11], row[11:19])
+        return self.columns
+
+
+def save_checkpoint(engine, path, rows_read, table_rows):
+    """
+    Saves the engine state, the number of rows read from each yearly file and the number of
+    rows of the matches table built from them. The file is written next to its destination
+    and then renamed, so an interrupted run never leaves a truncated checkpoint behind.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": CHECKPOINT_VERSION, "engine": engine, "rows_read": rows_read,
+                     "table_rows": table_rows}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint written by save_checkpoint.
+
+    :return: Tuple (engine, rows_read, table_rows).
+    """
+    with open(path, "rb") as f:
+        checkpoint = pickle.load(f)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError("Unsupported checkpoint version: " + str(checkpoint.get("version")))
+    return checkpoint["engine"], checkpoint["rows_read"], checkpoint["table_rows"]
@@ -0,0 +1,128 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# Columns of the yearly match CSVs used by the pipelines, with the dtype they are read as.
+# "Int64" is pandas' nullable integer: draw_size holds a few blanks and non-numeric values.
+MATCH_SCHEMA = {
+    "surface": "str",
+    "draw_size": "Int64",
+    "tourney_date": "int64",
+    "winner_id": "int64",
+    "winner_ht": "float64",
+    "winner_age": "float64",
+    "loser_id": "int64",
+    "loser_ht": "float64",
+    "loser_age": "float64",
+    "best_of": "int64",
+    "w_ace": "float64", "w_df": "float64", "w_svpt": "float64", "w_1stIn": "float64",
+    "w_1stWon": "float64", "w_2ndWon": "float64", "w_SvGms": "float64",
+    "w_bpSaved": "float64", "w_bpFaced": "float64",
+    "l_ace": "float64", "l_df": "float64", "l_svpt": "float64", "l_1stIn": "float64",
+    "l_1stWon": "float64", "l_2ndWon": "float64", "l_SvGms": "float64",
+    "l_bpSaved": "float64", "l_bpFaced": "float64",
+    "winner_rank": "float64",
+    "winner_rank_points": "float64",
+    "loser_rank": "float64",
+    "loser_rank_points": "float64",
+}
+
+# Bump when MATCH_SCHEMA or the cache layout changes so stale caches are ignored
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = "./data/CSV/.cache/"
+
+
+def read_match_csv(file):
+    """
+    Reads the needed columns of one yearly match CSV with the explicit MATCH_SCHEMA dtypes.
+    Non-numeric draw sizes (e.g. 'exho') are read as missing.
+    """
+    dtypes = {col: ("float64" if dtype == "float64" else str) for col, dtype in MATCH_SCHEMA.items()
+              if dtype != "int64"}
+    df = pd.read_csv(file, usecols=list(MATCH_SCHEMA), dtype=dtypes)
+    for col, dtype in MATCH_SCHEMA.items():
+        if dtype == "Int64":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        elif dtype == "int64":
+            df[col] = df[col].astype("int64")
+    return df[list(MATCH_SCHEMA)]
+
+
+def _cache_key(file):
+    stat = os.stat(file)
+    return f"{CACHE_VERSION}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _save_cache(df, cache_file, key):
+    arrays = {"__key__": np.array(key)}
+    for col, dtype in MATCH_SCHEMA.items():
+        values = df[col]
+        if dtype in ("str", "Int64"):
+            mask = values.isna().to_numpy()
+            arrays[col + "__mask"] = mask
+            fill = "" if dtype == "str" else 0
+            values = values.fillna(fill).to_numpy(dtype=str if dtype == "str" else "int64")
+        arrays[col] = np.asarray(values)
+    tmp_file = cache_file + ".tmp.npz"
+    np.savez(tmp_file, **arrays)
+    os.replace(tmp_file, cache_file)
+
+
+def _load_cache(cache_file, key):
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            if str(data["__key__"]) != key:
+                return None
+            columns = {}
+            for col, dtype in MATCH_SCHEMA.items():
+                values = data[col]
+                if dtype == "str":
+                    values = pd.Series(values, dtype="str").mask(data[col + "__mask"])
+                elif dtype == "Int64":
+                    values = pd.arrays.IntegerArray(values, data[col + "__mask"])
+                columns[col] = values
+            return pd.DataFrame(columns)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_match_file(file, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Loads one yearly match CSV through the binary cache. The cache entry (one .npz per CSV,
+    one array per column) is keyed by the CSV's mtime and size, so it is rebuilt whenever the
+    CSV changes. Pass cache_dir=None to always parse the CSV.
+    """
+    if cache_dir is None:
+        return read_match_csv(file)
+    key = _cache_key(file)
+    cache_file = os.path.join(cache_dir, os.path.splitext(os.path.basename(file))[0] + ".npz")
+    df = _load_cache(cache_file, key) if os.path.exists(cache_file) else None
+    if df is None:
+        df = read_match_csv(file)
+        os.makedirs(cache_dir, exist_ok=True)
+        _save_cache(df, cache_file, key)
+    return df
+
+
+def load_match_years(start_year, end_year, csv_folder="./data/CSV/WTA/", cache_dir=DEFAULT_CACHE_DIR,
+                     workers=None, tour="wta"):
+    """
+    Loads the yearly match files '<tour>_matches_YYYY.csv' from start_year to end_year,
+    reading them in parallel threads. Both tours can share one cache_dir.
+
+    :return: List of DataFrames, one per year, in year order.
+    """
+    files = [f"{csv_folder}{tour}_matches_{year}.csv" for year in range(start_year, end_year + 1)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda file: load_match_file(file, cache_dir), files))
+
+
+def load_matches(start_year=1991, end_year=2024, csv_folder="./data/CSV/WTA/", cache_dir=DEFAULT_CACHE_DIR,
+                 workers=None, tour="wta"):
+    """
+    Loads and concatenates the yearly match files from start_year to end_year.
+    """
+    return pd.concat(load_match_years(start_year, end_year, csv_folder, cache_dir, workers, tour),
+                     ignore_index=True)
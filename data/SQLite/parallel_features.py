@@ -0,0 +1,117 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from tqdm import tqdm
+from feature_engine import FAMILIES, STREAM_COLUMNS, FeatureEngine, feature_columns
+import profiling
+
+
+def family_tasks():
+    """
+    Splits the feature families into independent tasks. Windowed families get
+    one task per window size, the others one task each.
+    """
+    tasks = []
+    for family, windows in FAMILIES.items():
+        if windows is None:
+            tasks.append({family: None})
+        else:
+            tasks += [{family: [k]} for k in windows]
+    return tasks
+
+
+def share_columns(df):
+    """
+    Copies the stream columns of the cleaned match frame into shared memory blocks.
+    Surfaces are shared as integer codes.
+
+    :return: Tuple (specs, blocks, surfaces). specs is picklable and is what workers
+             receive; blocks must be closed and unlinked by the caller.
+    """
+    specs = []
+    blocks = []
+    surfaces = []
+    for col in STREAM_COLUMNS:
+        values = df[col].to_numpy()
+        if col == "surface":
+            uniques, codes = np.unique(values.astype(str), return_inverse=True)
+            surfaces = uniques.tolist()
+            values = codes.astype(np.int64)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        specs.append((col, block.name, values.dtype.str, len(values)))
+        blocks.append(block)
+    return specs, blocks, surfaces
+
+
+def _attach_columns(specs, surfaces):
+    columns = {}
+    blocks = []
+    for col, name, dtype, n in specs:
+        block = shared_memory.SharedMemory(name=name)
+        values = np.ndarray((n,), dtype=dtype, buffer=block.buf)
+        if col == "surface":
+            values = np.asarray(surfaces, dtype=object)[values]
+        columns[col] = values
+        blocks.append(block)
+    return columns, blocks
+
+
+def task_name(families):
+    """'elo' for a family without windows, 'serve[20]' for one window of a windowed family."""
+    return ",".join(name if windows is None else f"{name}[{','.join(map(str, windows))}]"
+                    for name, windows in families.items())
+
+
+def _run_task(specs, surfaces, families):
+    columns, blocks = _attach_columns(specs, surfaces)
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        results = FeatureEngine(families).run(columns, progress=False)
+        # Timed in the worker, where the family's own cost can be told apart
+        return results, time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        del columns
+        for block in blocks:
+            block.close()
+
+
+def _collect(pool, specs, surfaces, tasks, results):
+    futures = [pool.submit(_run_task, specs, surfaces, families) for families in tasks]
+    rows = specs[0][3] if specs else 0
+    for families, future in zip(tasks, tqdm(futures, total=len(futures), disable=profiling.quiet())):
+        features, wall, cpu = future.result()
+        results.update(features)
+        profiling.record(task_name(families), wall, cpu, rows)
+
+
+def run_parallel(df, workers=None, pool=None):
+    """
+    Computes every feature family on a process pool. Each task replays the shared
+    match columns for its own family/window, and the results are assembled in the
+    usual column order whatever the order in which tasks finish.
+
+    :param df: Cleaned match frame in chronological order.
+    :param workers: Number of worker processes (defaults to the number of CPUs).
+    :param pool: Existing ProcessPoolExecutor to submit the tasks to instead of starting one,
+                 e.g. to share one pool between several builds. workers is then ignored.
+    :return: Dict mapping each feature column name to its list of values.
+    """
+    tasks = family_tasks()
+    specs, blocks, surfaces = share_columns(df)
+    results = {}
+    try:
+        if pool is None:
+            workers = min(workers or os.cpu_count() or 1, len(tasks))
+            with ProcessPoolExecutor(max_workers=workers) as own_pool:
+                _collect(own_pool, specs, surfaces, tasks, results)
+        else:
+            _collect(pool, specs, surfaces, tasks, results)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return {col: results[col] for col in feature_columns()}
@@ -0,0 +1,258 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from feature_engine import ELO_GRAD_WINDOWS, ELO_INIT, STREAM_COLUMNS, FeatureEngine, player_stats_columns
+from match_loader import load_match_years
+from matches_data import FIRST_YEAR, REQUIRED_COLUMNS
+import profiling
+from tours import tour_config
+
+HISTORY_DIR = "data/SQLite/history/"
+
+# Bump when the layout of a history directory changes
+HISTORY_VERSION = 2
+
+# Columns of each state: the players stats columns after player_id
+STATE_COLUMNS = player_stats_columns()[1:]
+
+# Dates are YYYYMMDD integers; a player's position times DATE_SPAN plus a date orders the
+# states by player and then date in a single sorted key
+DATE_SPAN = 10 ** 8
+# Same for the positions of the matches in the replay (rows of the matches table)
+MATCH_SPAN = 10 ** 12
+
+
+def to_yyyymmdd(dates):
+    """Dates as YYYYMMDD int64: integers are kept, strings and datetimes are converted."""
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.integer):
+        return dates.astype(np.int64)
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return (dates.year * 10000 + dates.month * 100 + dates.day).to_numpy(dtype=np.int64)
+
+
+def _check_target(dates, before):
+    if (dates is None) == (before is None):
+        raise ValueError("Pass either dates or before")
+
+
+def default_state():
+    """State of a player before their first match, as in the players stats table."""
+    state = np.full(len(STATE_COLUMNS), np.nan)
+    for col in ("final_elo", "elo_hard", "elo_clay", "elo_grass"):
+        state[STATE_COLUMNS.index(col)] = ELO_INIT
+    for n in ELO_GRAD_WINDOWS:
+        state[STATE_COLUMNS.index("elo_grad_last_" + str(n))] = 0
+    return state
+
+
+class PlayerHistory:
+    """
+    Point-in-time index of the players stats: the state of every player after each of their
+    matches (match count, win and serve windows, Elo, surface Elo and Elo slopes, the columns
+    of the players stats table), so the stats of any player can be read as of any date.
+
+    States are stored by player, then replay order: player_ids (sorted) and offsets delimit
+    each player's rows in dates, matches and values. A state's date is the latest tourney
+    date of the matches it includes, so "as of D" is the last state dated before D: matches
+    of tournaments starting on D or later are never included, and no query replays anything.
+
+    All the matches of a tournament share its tourney date, so a date cannot tell its rounds
+    apart: as of D leaves out every round of a tournament starting on D, and inclusive=True
+    includes them all, the fixture itself and the later rounds too. Each state therefore also
+    records the position of its match in the replay (its row in the matches table), and
+    lookups with before=k give the stats before the match of row k: every earlier match,
+    the earlier rounds of the same tournament included, as the matches table saw them.
+    """
+    def __init__(self, player_ids, offsets, dates, matches, values, columns=STATE_COLUMNS):
+        self.player_ids = player_ids
+        self.offsets = offsets
+        self.dates = dates
+        self.matches = matches
+        self.values = values
+        self.columns = list(columns)
+        positions = np.repeat(np.arange(len(player_ids), dtype=np.int64), np.diff(offsets))
+        self._keys = positions * DATE_SPAN + dates
+        self._match_keys = positions * MATCH_SPAN + matches
+
+    def __len__(self):
+        return len(self.dates)
+
+    def as_of(self, player_id, date=None, inclusive=False, before=None):
+        """
+        Stats of one player as of a date, or before a match of the matches table, with a
+        binary search among that player's states.
+
+        :param inclusive: Include the matches of tournaments starting on the date itself.
+        :param before: Row of the matches table: the stats used for that match (instead of date).
+        :return: Series indexed by the stats columns, None if the player had no match before.
+        """
+        _check_target(date, before)
+        i = np.searchsorted(self.player_ids, player_id)
+        if i == len(self.player_ids) or self.player_ids[i] != player_id:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if before is not None:
+            j = start + np.searchsorted(self.matches[start:end], before, side="left") - 1
+        else:
+            date = to_yyyymmdd([date])[0]
+            j = start + np.searchsorted(self.dates[start:end], date, side="right" if inclusive else "left") - 1
+        if j < start:
+            return None
+        return pd.Series(self.values[j], index=self.columns)
+
+    def lookup(self, player_ids, dates=None, columns=None, inclusive=False, before=None):
+        """
+        Stats of many (player, date) pairs at once, with one vectorized binary search.
+
+        :param columns: Stats columns to return (all by default).
+        :param before: Rows of the matches table, one per player, instead of dates: the stats
+                       each player had for that match (see the class docstring).
+        :return: Tuple (values, found): values is a float64 (pairs, columns) array holding the
+                 state of a new player (see default_state) for pairs without any earlier
+                 match, which found marks False.
+        """
+        _check_target(dates, before)
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        if before is not None:
+            keys, span, targets, side = self._match_keys, MATCH_SPAN, np.asarray(before, dtype=np.int64), "left"
+        else:
+            keys, span, targets = self._keys, DATE_SPAN, to_yyyymmdd(dates)
+            side = "right" if inclusive else "left"
+        columns = self.columns if columns is None else list(columns)
+        col_idx = [self.columns.index(col) for col in columns]
+
+        found = np.zeros(len(player_ids), dtype=bool)
+        rows = np.zeros(len(player_ids), dtype=np.int64)
+        if len(self.player_ids):
+            positions = np.minimum(np.searchsorted(self.player_ids, player_ids), len(self.player_ids) - 1)
+            rows = np.searchsorted(keys, positions * span + targets, side=side) - 1
+            found = (self.player_ids[positions] == player_ids) & (rows >= self.offsets[positions])
+
+        values = np.tile(default_state()[col_idx], (len(player_ids), 1))
+        values[found] = self.values[rows[found]][:, col_idx]
+        return values, found
+
+    def stats_as_of(self, player_ids, dates=None, inclusive=False, before=None):
+        """lookup as a DataFrame: player_id, date (or before), the stats columns and found."""
+        values, found = self.lookup(player_ids, dates, inclusive=inclusive, before=before)
+        frame = pd.DataFrame(values, columns=self.columns)
+        frame.insert(0, "player_id", np.asarray(player_ids, dtype=np.int64))
+        if before is not None:
+            frame.insert(1, "before", np.asarray(before, dtype=np.int64))
+        else:
+            frame.insert(1, "date", to_yyyymmdd(dates))
+        frame["found"] = found
+        return frame
+
+    def save(self, out_dir):
+        """
+        Writes the history as .npy files (memory-mappable by load) and a manifest, through
+        a temporary directory that then replaces out_dir.
+        """
+        tmp_dir = out_dir.rstrip("/") + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "player_ids.npy"), np.asarray(self.player_ids, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "dates.npy"), np.asarray(self.dates, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "matches.npy"), np.asarray(self.matches, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "values.npy"), np.ascontiguousarray(self.values, dtype=np.float64))
+        manifest = {
+            "history_version": HISTORY_VERSION,
+            "states": len(self.dates),
+            "players": len(self.player_ids),
+            "first_date": int(self.dates.min()) if len(self.dates) else None,
+            "last_date": int(self.dates.max()) if len(self.dates) else None,
+            "columns": self.columns,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        old_dir = out_dir.rstrip("/") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(out_dir):
+            os.replace(out_dir, old_dir)
+        os.replace(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, history_dir, mmap=True):
+        """Opens a saved history, the states being memory-mapped unless mmap=False."""
+        with open(os.path.join(history_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("history_version") != HISTORY_VERSION:
+            raise ValueError(f"{history_dir} was written with an incompatible history version")
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(history_dir, name + ".npy"), mmap_mode=mode)
+                  for name in ("player_ids", "offsets", "dates", "matches")]
+        values = np.load(os.path.join(history_dir, "values.npy"), mmap_mode=mode)
+        return cls(*[np.asarray(array) for array in arrays], values, manifest["columns"])
+
+
+def build_player_history(df, progress=True):
+    """
+    Replays the cleaned match frame (in the order of the matches table) through a
+    FeatureEngine and records the state of both players after each match, with the
+    match's position in the frame (its row in the matches table).
+
+    :param df: Cleaned matches with the STREAM_COLUMNS and tourney_date.
+    :param progress: Show a tqdm progress bar.
+    :return: PlayerHistory.
+    """
+    engine = FeatureEngine()
+    store = engine.store
+    n = len(df)
+    player_ids = np.empty(2 * n, dtype=np.int64)
+    dates = np.empty(2 * n, dtype=np.int64)
+    matches = np.repeat(np.arange(n, dtype=np.int64), 2)
+    values = np.empty((2 * n, len(STATE_COLUMNS)), dtype=np.float64)
+    tourney_dates = df["tourney_date"].to_numpy(dtype=np.int64)
+
+    columns = [df[col].tolist() for col in STREAM_COLUMNS]
+    with profiling.stage("replay", n):
+        for i, row in enumerate(tqdm(zip(*columns), total=n, disable=not progress)):
+            engine.update(row[0], row[1], row[2], row[3:11], row[11:19])
+            for j, pid in ((2 * i, row[0]), (2 * i + 1, row[1])):
+                player_ids[j] = pid
+                dates[j] = tourney_dates[i]
+                values[j] = engine.player_state(store.index[pid])
+
+    with profiling.stage("index", 2 * n):
+        # By player, then in replay order, which is the order the states follow each other
+        order = np.lexsort((np.arange(2 * n), player_ids))
+        player_ids, dates, matches, values = player_ids[order], dates[order], matches[order], values[order]
+        unique_ids, starts = np.unique(player_ids, return_index=True)
+        offsets = np.append(starts, 2 * n).astype(np.int64)
+        # A state holds every match replayed before it, so it is dated by the latest of their
+        # dates (the files are not strictly in date order): a running maximum per player
+        positions = np.repeat(np.arange(len(unique_ids), dtype=np.int64), np.diff(offsets))
+        dates = np.maximum.accumulate(positions * DATE_SPAN + dates) - positions * DATE_SPAN
+    return PlayerHistory(unique_ids, offsets, dates, matches, values)
+
+
+def build_tour_history(tour="wta", end_year=2024, history_dir=HISTORY_DIR):
+    """
+    Builds the point-in-time history of a tour from its match files, cleaned as for the
+    matches table, and saves it in '<history_dir>/<matches table>/'.
+
+    :return: PlayerHistory.
+    """
+    config = tour_config(tour)
+    with profiling.stage("load") as stage:
+        all_data = pd.concat(load_match_years(FIRST_YEAR, end_year, config["csv_folder"], tour=tour.lower()))
+        stage.rows = len(all_data)
+    with profiling.stage("clean", len(all_data)):
+        matches = all_data.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+    history = build_player_history(matches, progress=not profiling.quiet())
+    with profiling.stage("save", len(history)):
+        history.save(os.path.join(history_dir, config["matches_table"]))
+    return history
+
+
+if __name__ == "__main__":
+    with profiling.session("player_history"):
+        build_tour_history()
@@ -1,208 +1,182 @@
-import numpy as np
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import sqlite3
+from match_loader import load_matches
+import profiling
+from rolling import RunningSlope
+from storage import write_table
+from tours import tour_config
 
-def load_and_clean_atp_matches(start_year=1991, end_year=2024, csv_folder="./data/CSV/WTA/"):
-    dfs = []
-    for year in range(start_year, end_year + 1):
-        file_path = f"{csv_folder}wta_matches_{year}.csv"
-        year_data = pd.read_csv(file_path, low_memory=False)
-
-        numeric_cols = [
-            "w_ace", "w_df", "w_svpt", "w_1stIn", "w_1stWon", "w_2ndWon", "w_SvGms", "w_bpSaved", "w_bpFaced",
-            "l_ace", "l_df", "l_svpt", "l_1stIn", "l_1stWon", "l_2ndWon", "l_SvGms", "l_bpSaved", "l_bpFaced",
-        ]
+def load_and_clean_atp_matches(start_year=1991, end_year=2024, csv_folder=None, tour="wta"):
+    all_cols = [
+        'winner_id', 'loser_id', 'w_ace', 'w_df', 'w_svpt', 'w_1stIn', 'w_1stWon', 'w_2ndWon', 'w_SvGms', 'w_bpSaved', 'w_bpFaced',
+        'l_ace', 'l_df', 'l_svpt', 'l_1stIn', 'l_1stWon', 'l_2ndWon', 'l_SvGms', 'l_bpSaved', 'l_bpFaced',
+        'surface'
+    ]
 
-        for col in numeric_cols:
-            year_data[col] = pd.to_numeric(year_data[col], errors='coerce')
-
-        all_cols = [
-            'winner_id', 'loser_id', 'w_ace', 'w_df', 'w_svpt', 'w_1stIn', 'w_1stWon', 'w_2ndWon', 'w_SvGms', 'w_bpSaved', 'w_bpFaced',
-            'l_ace', 'l_df', 'l_svpt', 'l_1stIn', 'l_1stWon', 'l_2ndWon', 'l_SvGms', 'l_bpSaved', 'l_bpFaced',
-            'surface'
-        ]
+    if csv_folder is None:
+        csv_folder = tour_config(tour)["csv_folder"]
+    with profiling.stage("load") as stage:
+        all_data = load_matches(start_year, end_year, csv_folder, tour=tour.lower())
+        stage.rows = len(all_data)
+    with profiling.stage("clean", len(all_data)):
+        all_data_filtered = all_data.dropna(subset=all_cols).reset_index(drop=True)
+    return all_data_filtered
 
-        year_data = year_data.dropna(subset=all_cols)
-        dfs.append(year_data)
+def player_appearances(df):
+    """
+    Reshapes the matches into one row per player appearance (each match appears twice,
+    once for the winner and once for the loser) with the player's result and serve
+    percentages in that match. Percentages with a zero denominator are NaN.
 
-    all_data_filtered = pd.concat(dfs, ignore_index=True)
-    return all_data_filtered
+    :param df: DataFrame containing the matches.
+    :return: DataFrame with columns player_id, tourney_date, match (row position in df),
+             result and the six p_* metrics.
+    """
+    frames = []
+    for side, id_col, result in (("w", "winner_id", 1), ("l", "loser_id", 0)):
+        svpt = df[f'{side}_svpt'].to_numpy(dtype=float)
+        first_in = df[f'{side}_1stIn'].to_numpy(dtype=float)
+        bp_faced = df[f'{side}_bpFaced'].to_numpy(dtype=float)
+        second = svpt - first_in
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frame = pd.DataFrame({
+                'player_id': df[id_col].to_numpy(),
+                'tourney_date': df['tourney_date'].to_numpy(dtype='int64'),
+                'match': np.arange(len(df)),
+                'result': result,
+                'p_ace': np.where(svpt != 0, 100 * (df[f'{side}_ace'].to_numpy(dtype=float) / svpt), np.nan),
+                'p_df': np.where(svpt != 0, 100 * (df[f'{side}_df'].to_numpy(dtype=float) / svpt), np.nan),
+                'p_1stIn': np.where(svpt != 0, 100 * (first_in / svpt), np.nan),
+                'p_1stWon': np.where(first_in != 0, 100 * (df[f'{side}_1stWon'].to_numpy(dtype=float) / first_in), np.nan),
+                'p_2ndWon': np.where(second != 0, 100 * (df[f'{side}_2ndWon'].to_numpy(dtype=float) / second), np.nan),
+                'p_bpSaved': np.where(bp_faced != 0, 100 * (df[f'{side}_bpSaved'].to_numpy(dtype=float) / bp_faced), np.nan),
+            })
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
 
 def compute_final_player_stats(df, player_ids):
     """
     Calculates global statistics (win rate, performance metrics and Elo)
     for the provided list of player_ids.
+
+    The matches are reshaped once into one row per player appearance, ordered from the
+    most recent (matches of the same date keep their file order), and every window is
+    a groupby over the first k appearances of each player.
     
     :param df: DataFrame containing ATP matches.
     :param player_ids: List of player identifiers to be processed.
     :return: DataFrame merging match stats and Elo statistics.
     """
-    
-    def compute_player_stats_for_player(pid, df):
-        cols = ['player_id', 'n_games', 
-                'win_last_3', 'win_last_5', 'win_last_10', 
-                'win_last_25', 'win_last_50', 'win_last_100']
-        player_matches = df[(df['winner_id'] == pid) | (df['loser_id'] == pid)].copy()
-        if player_matches.empty:
-            return pd.DataFrame(columns=cols)
-        player_matches['tourney_date'] = player_matches['tourney_date'].astype('int64')
-        player_matches = player_matches.sort_values(by='tourney_date', ascending=False).reset_index(drop=True)
-        n_games = len(player_matches)
-        player_matches['result'] = player_matches.apply(lambda row: 1 if row['winner_id'] == pid else 0, axis=1)
-        windows = [3, 5, 10, 25, 50, 100]
-        stats = {'player_id': pid, 'n_games': n_games}
-        for k in windows:
-            last_k = player_matches.head(k)
-            stats[f'win_last_{k}'] = last_k['result'].mean() if not last_k.empty else 0.0
-        return pd.DataFrame([stats], columns=cols)
-    
-    def compute_player_performance_for_player(pid, df):
-        def safe_mean(values):
-            valid = [v for v in values if pd.notna(v)]
-            return sum(valid) / len(valid) if valid else 50.0
+    win_windows = [3, 5, 10, 25, 50, 100]
+    perf_windows = [3, 5, 10, 20, 50, 100, 200, 300, 2000]
+    metrics = ['p_ace', 'p_df', 'p_1stIn', 'p_1stWon', 'p_2ndWon', 'p_bpSaved']
+    cols = (['player_id', 'n_games'] + [f'win_last_{k}' for k in win_windows]
+            + [f"{m}_last_{k}" for k in perf_windows for m in metrics])
 
-        metrics_list = []
-        player_matches = df[(df['winner_id'] == pid) | (df['loser_id'] == pid)].copy()
-        if player_matches.empty:
-            cols = ['player_id', 'n_games'] + [f"{m}_last_{k}" for k in [3, 5, 10, 20, 50, 100, 200, 300, 2000] 
-                        for m in ['p_ace', 'p_df', 'p_1stIn', 'p_1stWon', 'p_2ndWon', 'p_bpSaved']]
-            return pd.DataFrame(columns=cols)
-        player_matches['tourney_date'] = player_matches['tourney_date'].astype('int64')
-        player_matches = player_matches.sort_values(by='tourney_date', ascending=False).reset_index(drop=True)
-        n_games = len(player_matches)
-        for _, row in player_matches.iterrows():
-            if row['winner_id'] == pid:
-                p_ace = 100 * (row['w_ace'] / row['w_svpt']) if row['w_svpt'] != 0 else None
-                p_df = 100 * (row['w_df'] / row['w_svpt']) if row['w_svpt'] != 0 else None
-                p_1stIn = 100 * (row['w_1stIn'] / row['w_svpt']) if row['w_svpt'] != 0 else None
-                p_1stWon = 100 * (row['w_1stWon'] / row['w_1stIn']) if row['w_1stIn'] != 0 else None
-                denom = row['w_svpt'] - row['w_1stIn']
-                p_2ndWon = 100 * (row['w_2ndWon'] / denom) if denom != 0 else None
-                p_bpSaved = 100 * (row['w_bpSaved'] / row['w_bpFaced']) if row['w_bpFaced'] != 0 else None
-            else:
-                p_ace = 100 * (row['l_ace'] / row['l_svpt']) if row['l_svpt'] != 0 else None
-                p_df = 100 * (row['l_df'] / row['l_svpt']) if row['l_svpt'] != 0 else None
-                p_1stIn = 100 * (row['l_1stIn'] / row['l_svpt']) if row['l_svpt'] != 0 else None
-                p_1stWon = 100 * (row['l_1stWon'] / row['l_1stIn']) if row['l_1stIn'] != 0 else None
-                denom = row['l_svpt'] - row['l_1stIn']
-                p_2ndWon = 100 * (row['l_2ndWon'] / denom) if denom != 0 else None
-                p_bpSaved = 100 * (row['l_bpSaved'] / row['l_bpFaced']) if row['l_bpFaced'] != 0 else None
-            metrics_list.append({
-                'p_ace': p_ace,
-                'p_df': p_df,
-                'p_1stIn': p_1stIn,
-                'p_1stWon': p_1stWon,
-                'p_2ndWon': p_2ndWon,
-                'p_bpSaved': p_bpSaved
-            })
-        windows = [3, 5, 10, 20, 50, 100, 200, 300, 2000]
-        stats = {'player_id': pid, 'n_games': n_games}
-        for k in windows:
-            window_metrics = metrics_list[:k]
-            stats[f'p_ace_last_{k}'] = safe_mean([m['p_ace'] for m in window_metrics])
-            stats[f'p_df_last_{k}'] = safe_mean([m['p_df'] for m in window_metrics])
-            stats[f'p_1stIn_last_{k}'] = safe_mean([m['p_1stIn'] for m in window_metrics])
-            stats[f'p_1stWon_last_{k}'] = safe_mean([m['p_1stWon'] for m in window_metrics])
-            stats[f'p_2ndWon_last_{k}'] = safe_mean([m['p_2ndWon'] for m in window_metrics])
-            stats[f'p_bpSaved_last_{k}'] = safe_mean([m['p_bpSaved'] for m in window_metrics])
-        cols = ['player_id', 'n_games'] + [f"{m}_last_{k}" for k in windows for m in 
-                ['p_ace', 'p_df', 'p_1stIn', 'p_1stWon', 'p_2ndWon', 'p_bpSaved']]
-        return pd.DataFrame([stats], columns=cols)
-    
-    stats_list = []
-    for pid in tqdm(player_ids):
-        s_df = compute_player_stats_for_player(pid, df)
-        p_df = compute_player_performance_for_player(pid, df)
-        if s_df.empty and p_df.empty:
-            continue
-        merged = pd.merge(s_df, p_df, on=['player_id', 'n_games'], how='outer')
-        stats_list.append(merged)
-    if stats_list:
-        stats_df = pd.concat(stats_list, ignore_index=True)
-    else:
-        stats_df = pd.DataFrame()
-    
+    with profiling.stage("windows", len(df)):
+        appearances = player_appearances(df)
+        appearances = appearances[appearances['player_id'].isin(player_ids)]
+        order = np.lexsort((appearances['match'].to_numpy(), -appearances['tourney_date'].to_numpy(),
+                            appearances['player_id'].to_numpy()))
+        appearances = appearances.iloc[order].reset_index(drop=True)
+        # Position of each appearance counted from the player's most recent match
+        recency = appearances.groupby('player_id').cumcount().to_numpy()
 
-    df_sorted = df.sort_values(by='tourney_date').reset_index(drop=True)
-    k_constant = 24
-    surfaces = ["Hard", "Clay", "Grass"]
-    elo_overall = defaultdict(lambda: 1500)
-    elo_history = defaultdict(list)
-    elo_surface = {s: defaultdict(lambda: 1500) for s in surfaces}
-    elo_surface_history = {s: defaultdict(list) for s in surfaces}
-    
-    for _, row in tqdm(df_sorted.iterrows(), total=len(df_sorted)):
-        w_id = row['winner_id']
-        l_id = row['loser_id']
-        surface = row['surface']
+        stats_df = appearances.groupby('player_id').size().rename('n_games').to_frame()
+        for k in win_windows:
+            stats_df[f'win_last_{k}'] = appearances[recency < k].groupby('player_id')['result'].mean()
+        for k in perf_windows:
+            window_means = appearances[recency < k].groupby('player_id')[metrics].mean().fillna(50.0)
+            for m in metrics:
+                stats_df[f"{m}_last_{k}"] = window_means[m]
+        stats_df = stats_df.reset_index()[cols]
 
-        elo_w = elo_overall[w_id]
-        elo_l = elo_overall[l_id]
-        exp_w = 1 / (1 + 10 ** ((elo_l - elo_w) / 400))
-        exp_l = 1 / (1 + 10 ** ((elo_w - elo_l) / 400))
-        new_elo_w = elo_w + k_constant * (1 - exp_w)
-        new_elo_l = elo_l + k_constant * (0 - exp_l)
-        elo_overall[w_id] = new_elo_w
-        elo_overall[l_id] = new_elo_l
-        elo_history[w_id].append(new_elo_w)
-        elo_history[l_id].append(new_elo_l)
+    with profiling.stage("elo", len(df)):
+        df_sorted = df.sort_values(by='tourney_date', kind='stable').reset_index(drop=True)
+        k_constant = 24
+        surfaces = ["Hard", "Clay", "Grass"]
+        elo_overall = defaultdict(lambda: 1500)
+        elo_trend = defaultdict(lambda: RunningSlope(origin=1500))
+        elo_surface = {s: defaultdict(lambda: 1500) for s in surfaces}
 
-        if surface in surfaces:
-            elo_w_s = elo_surface[surface][w_id]
-            elo_l_s = elo_surface[surface][l_id]
-            exp_w_s = 1 / (1 + 10 ** ((elo_l_s - elo_w_s) / 400))
-            exp_l_s = 1 / (1 + 10 ** ((elo_w_s - elo_l_s) / 400))
-            new_elo_w_s = elo_w_s + k_constant * (1 - exp_w_s)
-            new_elo_l_s = elo_l_s + k_constant * (0 - exp_l_s)
-            elo_surface[surface][w_id] = new_elo_w_s
-            elo_surface[surface][l_id] = new_elo_l_s
-            elo_surface_history[surface][w_id].append(new_elo_w_s)
-            elo_surface_history[surface][l_id].append(new_elo_l_s)
-    
-    windows = [5, 10, 20, 35, 50, 100, 250]
-    elo_data = []
-    for pid in player_ids:
-        final_elo = elo_overall[pid]
-        final_elo_hard = elo_surface["Hard"][pid]
-        final_elo_clay = elo_surface["Clay"][pid]
-        final_elo_grass = elo_surface["Grass"][pid]
-        history = elo_history[pid]
-        grad_stats = {}
-        for w in windows:
-            if len(history) >= w:
-                x = np.arange(len(history))
-                slope = np.polyfit(x, np.array(history), 1)[0]
-            else:
-                slope = 0
-            grad_stats[f'elo_grad_last_{w}'] = slope
-        elo_entry = {
-            'player_id': pid,
-            'final_elo': final_elo,
-            'elo_hard': final_elo_hard,
-            'elo_clay': final_elo_clay,
-            'elo_grass': final_elo_grass
-        }
-        elo_entry.update(grad_stats)
-        elo_data.append(elo_entry)
-    elo_df = pd.DataFrame(elo_data)
+        for w_id, l_id, surface in tqdm(zip(df_sorted['winner_id'].tolist(), df_sorted['loser_id'].tolist(),
+                                             df_sorted['surface'].tolist()), total=len(df_sorted),
+                                         disable=profiling.quiet()):
+            elo_w = elo_overall[w_id]
+            elo_l = elo_overall[l_id]
+            exp_w = 1 / (1 + 10 ** ((elo_l - elo_w) / 400))
+            exp_l = 1 / (1 + 10 ** ((elo_w - elo_l) / 400))
+            new_elo_w = elo_w + k_constant * (1 - exp_w)
+            new_elo_l = elo_l + k_constant * (0 - exp_l)
+            elo_overall[w_id] = new_elo_w
+            elo_overall[l_id] = new_elo_l
+            elo_trend[w_id].push(new_elo_w)
+            elo_trend[l_id].push(new_elo_l)
+
+            if surface in surfaces:
+                elo_w_s = elo_surface[surface][w_id]
+                elo_l_s = elo_surface[surface][l_id]
+                exp_w_s = 1 / (1 + 10 ** ((elo_l_s - elo_w_s) / 400))
+                exp_l_s = 1 / (1 + 10 ** ((elo_w_s - elo_l_s) / 400))
+                new_elo_w_s = elo_w_s + k_constant * (1 - exp_w_s)
+                new_elo_l_s = elo_l_s + k_constant * (0 - exp_l_s)
+                elo_surface[surface][w_id] = new_elo_w_s
+                elo_surface[surface][l_id] = new_elo_l_s
+
+        windows = [5, 10, 20, 35, 50, 100, 250]
+        elo_data = []
+        for pid in player_ids:
+            final_elo = elo_overall[pid]
+            final_elo_hard = elo_surface["Hard"][pid]
+            final_elo_clay = elo_surface["Clay"][pid]
+            final_elo_grass = elo_surface["Grass"][pid]
+            trend = elo_trend.get(pid)
+            grad_stats = {}
+            for w in windows:
+                if trend is not None and len(trend) >= w:
+                    slope = trend.slope()
+                else:
+                    slope = 0
+                grad_stats[f'elo_grad_last_{w}'] = slope
+            elo_entry = {
+                'player_id': pid,
+                'final_elo': final_elo,
+                'elo_hard': final_elo_hard,
+                'elo_clay': final_elo_clay,
+                'elo_grass': final_elo_grass
+            }
+            elo_entry.update(grad_stats)
+            elo_data.append(elo_entry)
+        elo_df = pd.DataFrame(elo_data)
     
     final_df = pd.merge(stats_df, elo_df, on='player_id', how='outer')
     return final_df
 
-def player_ids_from_sqlite(db_path):
-    conn = sqlite3.connect(db_path)
+def player_ids_from_sqlite(db_path, tour="wta"):
+    conn = sqlite3.connect(db_path, timeout=60)
     cursor = conn.cursor()
-    cursor.execute("SELECT player_id FROM 'players(w)_informations'")
+    cursor.execute(f"SELECT player_id FROM '{tour_config(tour)['players_informations']}'")
     player_ids = [row[0] for row in cursor.fetchall()]
     conn.close()
     return player_ids
 
-matches_df = load_and_clean_atp_matches()
-external_player_ids = player_ids_from_sqlite("data/SQLite/tennis.db")
-print("Nombre de joueurs externes chargés :", len(external_player_ids))
-final_player_stats = compute_final_player_stats(matches_df, player_ids=external_player_ids)
-conn = sqlite3.connect("data/SQLite/tennis.db")
-final_player_stats.to_sql("players(w)_stats", conn, if_exists="replace", index=False)
-conn.close()
\ No newline at end of file
+def build_player_stats(db_path="data/SQLite/tennis.db", tour="wta"):
+    """
+    Computes the final statistics of every registered player of a tour and writes
+    them to the tour's players stats table ('players(w)_stats' for the WTA).
+    """
+    matches_df = load_and_clean_atp_matches(tour=tour)
+    external_player_ids = player_ids_from_sqlite(db_path, tour)
+    if not profiling.quiet():
+        print("Nombre de joueurs externes chargés :", len(external_player_ids))
+    with profiling.stage("player_stats", len(matches_df)):
+        final_player_stats = compute_final_player_stats(matches_df, player_ids=external_player_ids)
+    with profiling.stage("write", len(final_player_stats)):
+        write_table(db_path, tour_config(tour)["players_stats"], final_player_stats, indexes=["player_id"])
+
+if __name__ == "__main__":
+    with profiling.session("player_stats"):
+        build_player_stats()
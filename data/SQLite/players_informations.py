@@ -1,14 +1,18 @@
-import sqlite3
 import pandas as pd
 from datetime import datetime
+from storage import write_table
+from tours import tour_config
 
-def create_players_table(csv_file, db_file):
+def create_players_table(csv_file=None, db_file="data/SQLite/tennis.db", tour="wta"):
     """
-    Create an SQLite database table named 'players_informations' from a CSV file.
+    Create the typed players informations table of a tour from a CSV file.
 
     Parameters:
-    csv_file (str): Path to the input CSV file containing tennis players data.
+    csv_file (str): Path to the input CSV file containing tennis players data
+                    (defaults to the tour's players file).
     db_file (str): Path to the output SQLite database file.
+    tour (str): 'atp' or 'wta'. The data is written to the tour's informations table
+                ('players_informations' or 'players(w)_informations').
 
     The CSV file must have columns: player_id, name_first, name_last, hand, dob, ioc, height.
 
@@ -24,6 +28,9 @@ def create_players_table(csv_file, db_file):
     Returns:
     None
     """
+    config = tour_config(tour)
+    if csv_file is None:
+        csv_file = config["players_csv"]
     df = pd.read_csv(csv_file, header=0, low_memory=False)
 
     df = df.dropna(subset=['player_id', 'name_first', 'name_last'])
@@ -45,25 +52,15 @@ def create_players_table(csv_file, db_file):
     
     df = df[['player_id', 'name_first', 'name_last', 'hand', 'dob', 'ioc', 'height']]
 
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS players_informations (
-        player_id INTEGER PRIMARY KEY,
-        name_first TEXT NOT NULL,
-        name_last TEXT NOT NULL,
-        hand TEXT CHECK(hand IN ('L', 'R', 'U')) NOT NULL,
-        dob DATE,
-        ioc TEXT(3),
-        height INTEGER
-    )
-    ''')
-
-    df.to_sql('players(w)_informations', conn, if_exists='replace', index=False)
-
-    conn.commit()
-    conn.close()
+    write_table(db_file, config['players_informations'], df, columns=[
+        'player_id INTEGER PRIMARY KEY',
+        'name_first TEXT NOT NULL',
+        'name_last TEXT NOT NULL',
+        "hand TEXT CHECK(hand IN ('L', 'R', 'U')) NOT NULL",
+        'dob DATE',
+        'ioc TEXT(3)',
+        'height INTEGER',
+    ])
 
 if __name__ == '__main__':
     create_players_table('data/CSV/WTA/wta_players.csv', 'data/SQLite/tennis.db')
\ No newline at end of file
@@ -0,0 +1,353 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+
+# Environment variables read by session(): where to write the run report, which stage to
+# sample with the profiler, and whether to silence progress bars and summaries
+REPORT_ENV = "TENNIS_PROFILE"
+PROFILE_STAGE_ENV = "TENNIS_PROFILE_STAGE"
+QUIET_ENV = "TENNIS_QUIET"
+
+# Seconds between two samples of the sampling profiler (the interpreter's switch interval)
+SAMPLE_INTERVAL = 0.005
+
+_active = None
+_local = threading.local()
+
+
+def rss_kb(field="VmRSS"):
+    """VmRSS (or another /proc/self/status field, e.g. VmHWM) in kB on Linux, None elsewhere."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Resets the peak RSS (VmHWM) to the current RSS. :return: Whether the platform allows it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    """Peak RSS in kB since the last reset_peak_rss (since the start of the process elsewhere)."""
+    peak = rss_kb("VmHWM")
+    if peak is None:
+        # ru_maxrss is in kB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak //= 1024
+    return peak
+
+
+def quiet():
+    """Whether progress bars and summaries should be left out (TENNIS_QUIET=1 or a quiet session)."""
+    return os.environ.get(QUIET_ENV, "") not in ("", "0") or (_active is not None and _active.quiet)
+
+
+class _NullStage:
+    """What stage() returns outside a session: records nothing, costs one call."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, rows):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = "/".join(stack + [self.name])
+        stack.append(self.name)
+        self.peak_kb = self.profiler._open(self)
+        self.rss_before_kb = rss_kb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        if self.profiler.sampler is not None and self.profiler.profile_stage in (self.name, self.path):
+            self.profiler.sampler.start(threading.get_ident())
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        if self.profiler.sampler is not None and self.profiler.profile_stage in (self.name, self.path):
+            self.profiler.sampler.stop(threading.get_ident())
+        _stack().pop()
+        self.profiler._close(self, wall, cpu)
+        return False
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class Sampler:
+    """
+    Sampling profiler: a background thread records the Python stack of each profiled thread
+    every `interval` seconds. Counts are kept per line for the self time ('file:function:line'
+    of the innermost frame) and per call stack ('file:function' frames joined by ';', the
+    folded format read by flame graph tools).
+
+    Several threads can be profiled at once (e.g. the same stage of the ATP and WTA builds
+    of build_tours.py running in two threads): each start(thread_id) adds a thread to the
+    sampled ones until its matching stop(thread_id), and the background thread runs while
+    any thread is sampled.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lines = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self._threads = Counter()
+        self._thread = None
+        self._stop = None
+        self._lock = threading.Lock()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._threads[thread_id] += 1
+            if self._thread is None:
+                # One event per background thread, so a restart never revives a stopping one
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+            if self._threads or self._thread is None:
+                return
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        thread.join()
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._sample(frame)
+
+    def _sample(self, frame):
+        code = frame.f_code
+        self.lines[f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"] += 1
+        stack = []
+        while frame is not None:
+            stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def top(self, n=25):
+        return [{"line": line, "samples": count, "share": round(count / self.samples, 4)}
+                for line, count in self.lines.most_common(n)]
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Records the stages of one run (a build, a training...) and writes them as a JSON report.
+
+    Pipeline code marks its stages with `with profiling.stage(name, rows):`, which does
+    nothing unless a Profiler is active. For each stage path (stages nest, e.g.
+    'import/features'; repeated stages are summed under one entry), the report holds the wall
+    time, the CPU time of the process (all threads, including native ones such as XGBoost's),
+    the rows processed and rows/s, and the peak RSS: process-wide, so stages running
+    concurrently in threads share their peaks. Stages timed in other processes can be added
+    with record().
+
+    :param report_path: JSON file the report is written to when the run ends (None to only
+                        keep it in memory, see report()).
+    :param quiet: Print no summary and disable the progress bars of the pipeline (see quiet()).
+    :param profile_stage: Name or path of a stage to sample with the Sampler; its hottest
+                          lines go in the report and its folded stacks next to it ('.folded').
+                          When the stage runs in several threads at once, every thread
+                          running it is sampled into the same profile.
+    """
+    def __init__(self, name, report_path=None, quiet=False, profile_stage=None, interval=SAMPLE_INTERVAL):
+        self.name = name
+        self.report_path = report_path
+        self.quiet = quiet
+        self.profile_stage = profile_stage
+        self.sampler = Sampler(interval) if profile_stage else None
+        self.stages = {}
+        # Kept here since the resets of the stages also reset the process's own maximum (ru_maxrss)
+        self.peak_kb = 0
+        self._open_stages = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        _active = self
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self.wall = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+        _active = None
+        if self.report_path is not None:
+            self.write(self.report_path)
+        if not self.quiet:
+            self.print_summary()
+        return False
+
+    def stage(self, name, rows=None):
+        return _Stage(self, name, rows)
+
+    def _open(self, stage):
+        with self._lock:
+            # The peak is reset for the new stage, so the stages already open keep the peak so far
+            peak = peak_rss_kb()
+            self.peak_kb = max(self.peak_kb, peak)
+            for other in self._open_stages:
+                other.peak_kb = max(other.peak_kb, peak)
+            self._open_stages.append(stage)
+            # Entries are listed in the order their stages first start
+            self._entry(stage.path)
+            reset_peak_rss()
+            return peak_rss_kb()
+
+    def _close(self, stage, wall, cpu):
+        with self._lock:
+            self._open_stages.remove(stage)
+            peak = max(stage.peak_kb, peak_rss_kb())
+            self.peak_kb = max(self.peak_kb, peak)
+            for other in self._open_stages:
+                other.peak_kb = max(other.peak_kb, peak)
+            delta = peak - stage.rss_before_kb if stage.rss_before_kb is not None else None
+            self._add(stage.path, wall, cpu, stage.rows, peak, delta)
+
+    def record(self, path, wall, cpu, rows=None):
+        """Adds a stage timed elsewhere (e.g. in a worker process) under path, below the current stage."""
+        with self._lock:
+            self._add("/".join(_stack() + [path]), wall, cpu, rows, None, None)
+
+    def _entry(self, path):
+        return self.stages.setdefault(path, {"stage": path, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                             "rows": None, "peak_rss_mb": None, "peak_delta_mb": None})
+
+    def _add(self, path, wall, cpu, rows, peak_kb, delta_kb):
+        entry = self._entry(path)
+        entry["calls"] += 1
+        entry["wall_s"] += wall
+        entry["cpu_s"] += cpu
+        if rows is not None:
+            entry["rows"] = (entry["rows"] or 0) + int(rows)
+        if peak_kb is not None:
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0, round(peak_kb / 1024, 1))
+        if delta_kb is not None:
+            entry["peak_delta_mb"] = max(entry["peak_delta_mb"] or 0, round(delta_kb / 1024, 1))
+
+    def report(self):
+        stages = []
+        for entry in self.stages.values():
+            entry = dict(entry, wall_s=round(entry["wall_s"], 4), cpu_s=round(entry["cpu_s"], 4))
+            if entry["rows"] and entry["wall_s"] > 0:
+                entry["rows_per_s"] = round(entry["rows"] / entry["wall_s"], 1)
+            stages.append(entry)
+        report = {
+            "run": self.name,
+            "started": self.started,
+            "wall_s": round(getattr(self, "wall", time.perf_counter() - self._wall), 4),
+            "cpu_s": round(getattr(self, "cpu", time.process_time() - self._cpu), 4),
+            "peak_rss_mb": round(max(self.peak_kb, peak_rss_kb()) / 1024, 1),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "stages": stages,
+        }
+        if self.sampler is not None:
+            report["profile"] = {"stage": self.profile_stage, "interval_s": self.sampler.interval,
+                                 "samples": self.sampler.samples, "top": self.sampler.top()}
+        return report
+
+    def write(self, path):
+        report = self.report()
+        if self.sampler is not None and self.sampler.samples:
+            folded = os.path.splitext(path)[0] + ".folded"
+            self.sampler.write_folded(folded)
+            report["profile"]["folded"] = folded
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, path)
+
+    def print_summary(self):
+        report = self.report()
+        print(f"{report['run']}: {report['wall_s']:.2f}s wall, {report['cpu_s']:.2f}s CPU, "
+              f"{report['peak_rss_mb']:.0f} MB peak")
+        for entry in report["stages"]:
+            rate = f"{entry['rows_per_s']:>12,.0f} rows/s" if "rows_per_s" in entry else " " * 19
+            peak = f"{entry['peak_rss_mb']:>8.0f} MB" if entry["peak_rss_mb"] is not None else ""
+            print(f"  {entry['stage']:<40}{entry['wall_s']:>9.3f}s{entry['cpu_s']:>9.3f}s CPU {rate}{peak}")
+        if self.sampler is not None:
+            for line in report["profile"]["top"][:10]:
+                print(f"  {line['share']:>6.1%}  {line['line']}")
+
+
+def stage(name, rows=None):
+    """
+    Context manager marking a stage of the active run. Outside a run it does nothing.
+    The rows can also be set on the returned object once known (`with stage("load") as s: ...;
+    s.rows = len(df)`).
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, rows)
+
+
+def record(path, wall, cpu, rows=None):
+    """Profiler.record on the active run, if any."""
+    if _active is not None:
+        _active.record(path, wall, cpu, rows)
+
+
+def session(name):
+    """
+    The Profiler of a script's run as configured by the environment: TENNIS_PROFILE=<report.json>
+    records the run, TENNIS_PROFILE_STAGE=<stage> samples that stage and TENNIS_QUIET=1 runs
+    quietly. Without TENNIS_PROFILE the run is not recorded and the stages cost nothing.
+    """
+    report_path = os.environ.get(REPORT_ENV)
+    if not report_path:
+        return _NULL_STAGE
+    return Profiler(name, report_path, quiet=quiet(), profile_stage=os.environ.get(PROFILE_STAGE_ENV) or None)
@@ -0,0 +1,159 @@
+from array import array
+
+
+class RollingWindows:
+    """
+    Array-backed ring buffer keeping a running sum and count for several
+    trailing window sizes at once.
+
+    Each push costs O(number of windows) and each window mean is O(1),
+    whatever the window size. The buffer grows on demand up to the largest
+    window, so players with few matches stay small. As in RollingSlope, the
+    sum of a window of size k is rebuilt from the buffer once every k pushes
+    so rounding errors of float values cannot build up over long careers.
+    """
+    __slots__ = ("windows", "capacity", "buffer", "count", "sums")
+
+    def __init__(self, windows, typecode="d"):
+        self.windows = list(windows)
+        self.capacity = max(self.windows)
+        self.buffer = array(typecode)
+        self.count = 0
+        self.sums = [0] * len(self.windows)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def push(self, value):
+        n = self.count
+        cap = self.capacity
+        buf = self.buffer
+        sums = self.sums
+        for i, k in enumerate(self.windows):
+            # Evict the value leaving the window before it is overwritten
+            if n >= k:
+                sums[i] -= buf[(n - k) % cap]
+            sums[i] += value
+        if n < cap:
+            buf.append(value)
+        else:
+            buf[n % cap] = value
+        self.count = n + 1
+        for i, k in enumerate(self.windows):
+            if n >= k and self.count % k == 0:
+                # Same order (oldest first) as summing the window directly
+                total = 0
+                for j in range(self.count - k, self.count):
+                    total += buf[j % cap]
+                sums[i] = total
+
+    def mean(self, i, default):
+        """
+        Mean of the i-th window, or default when no value has been pushed yet.
+        """
+        n = min(self.count, self.windows[i])
+        if n == 0:
+            return default
+        return self.sums[i]/n
+
+
+def linear_slope(n, sum_y, sum_xy):
+    """
+    Least-squares slope of n points at x = 0, 1, ..., n-1 given their
+    running sums. Same value as np.polyfit(np.arange(n), y, 1)[0].
+    """
+    if n < 2:
+        return 0.0
+    sum_x = n*(n-1)//2
+    sum_xx = (n-1)*n*(2*n-1)//6
+    return (n*sum_xy - sum_x*sum_y)/(n*sum_xx - sum_x*sum_x)
+
+
+class RunningSlope:
+    """
+    Slope of the linear regression of every value pushed so far against its
+    position, kept in O(1) memory from running sums.
+
+    Values are stored relative to origin to keep the sums small; the slope
+    does not depend on it.
+    """
+    __slots__ = ("origin", "count", "sum_y", "sum_xy")
+
+    def __init__(self, origin=0):
+        self.origin = origin
+        self.count = 0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, value):
+        value -= self.origin
+        self.sum_xy += self.count*value
+        self.sum_y += value
+        self.count += 1
+
+    def slope(self):
+        return linear_slope(self.count, self.sum_y, self.sum_xy)
+
+
+class RollingSlope:
+    """
+    Ring buffer keeping, for several trailing window sizes at once, the
+    running sums needed for the linear regression slope of the window.
+
+    With x numbered 0..k-1 inside the window, sliding by one value changes
+    the sums as
+        sum_xy' = sum_xy - (sum_y - y_old) + (k-1)*y_new
+        sum_y'  = sum_y - y_old + y_new
+    so each push costs O(number of windows) and each slope is O(1). The sums of
+    a window of size k are rebuilt from the buffer once every k pushes (amortized
+    O(1)) so rounding errors cannot build up over long careers. A window's sums
+    only depend on its own size, not on the other windows kept alongside it.
+    """
+    __slots__ = ("windows", "capacity", "origin", "buffer", "count", "sums_y", "sums_xy")
+
+    def __init__(self, windows, origin=0):
+        self.windows = list(windows)
+        self.capacity = max(self.windows)
+        self.origin = origin
+        self.buffer = array("d")
+        self.count = 0
+        self.sums_y = [0.0] * len(self.windows)
+        self.sums_xy = [0.0] * len(self.windows)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def push(self, value):
+        value -= self.origin
+        n = self.count
+        cap = self.capacity
+        buf = self.buffer
+        sums_y = self.sums_y
+        sums_xy = self.sums_xy
+        for i, k in enumerate(self.windows):
+            if n < k:
+                sums_xy[i] += n*value
+                sums_y[i] += value
+            else:
+                # Evict the value leaving the window before it is overwritten
+                old = buf[(n - k) % cap]
+                sums_xy[i] += (k-1)*value - (sums_y[i] - old)
+                sums_y[i] += value - old
+        if n < cap:
+            buf.append(value)
+        else:
+            buf[n % cap] = value
+        self.count = n + 1
+        for i, k in enumerate(self.windows):
+            if n >= k and self.count % k == 0:
+                window = [buf[(self.count - k + j) % cap] for j in range(k)]
+                sums_y[i] = sum(window)
+                sums_xy[i] = sum(x*y for x, y in enumerate(window))
+
+    def slope(self, i):
+        """Slope of the i-th window (0 when it holds fewer than two values)."""
+        n = min(self.count, self.windows[i])
+        return linear_slope(n, self.sums_y[i], self.sums_xy[i])
@@ -0,0 +1,147 @@
+import datetime
+import sqlite3
+import pandas as pd
+
+# Rows sent per executemany call
+CHUNK_SIZE = 50000
+
+# Table holding a counter per table, bumped in the transaction that rewrites or appends to it,
+# so readers keeping derived data (e.g. the player vector cache in learning/) know when to drop it
+VERSIONS_TABLE = "table_versions"
+
+
+def quote(name):
+    """Quotes a table, column or index name for SQLite (names like 'players(w)_stats' need it)."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def connect(db_path, timeout=60):
+    """
+    Opens tennis.db in WAL mode, so readers keep reading the last committed tables while a
+    build writes. The connection is in autocommit mode: writers open their own transactions.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def column_type(dtype):
+    """SQLite column type of a pandas dtype."""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def _sql_values(series):
+    """Column values as Python objects SQLite can bind, missing values as None."""
+    values = series.astype(object).where(series.notna(), None).tolist()
+    if series.dtype == object:
+        values = [v.isoformat() if isinstance(v, datetime.date) else v for v in values]
+    return values
+
+
+def _insert(conn, table, df):
+    placeholders = ", ".join("?" * len(df.columns))
+    sql = f"INSERT INTO {quote(table)} VALUES ({placeholders})"
+    for start in range(0, len(df), CHUNK_SIZE):
+        chunk = df.iloc[start:start + CHUNK_SIZE]
+        conn.executemany(sql, zip(*(_sql_values(chunk[col]) for col in chunk.columns)))
+
+
+def write_table(db_path, table, df, columns=None, indexes=(), if_exists="replace"):
+    """
+    Writes a DataFrame to a typed SQLite table.
+
+    With if_exists="replace" the rows are loaded into a staging table, and the old table is
+    then dropped and the staging table renamed in one transaction, so readers see either
+    the old or the new table and never a half-written one. Indexes are rebuilt after the
+    rows are loaded. With if_exists="append" the rows are added in one transaction; the
+    table is created first if it does not exist. Either way the table's counter in
+    VERSIONS_TABLE is bumped in the same transaction.
+
+    :param columns: Column definitions ("name TYPE constraints"); derived from the dtypes when omitted.
+    :param indexes: Columns to index (one index each, named '<table>_<column>_idx').
+    """
+    if columns is None:
+        columns = [f"{quote(col)} {column_type(dtype)}" for col, dtype in df.dtypes.items()]
+    conn = connect(db_path)
+    try:
+        conn.execute("PRAGMA cache_size=-200000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if if_exists == "append":
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {quote(table)} ({', '.join(columns)})")
+            _insert(conn, table, df)
+            _create_indexes(conn, table, indexes)
+            _bump_version(conn, table)
+            conn.execute("COMMIT")
+            return
+
+        staging = table + "__staging"
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(staging)}")
+        conn.execute(f"CREATE TABLE {quote(staging)} ({', '.join(columns)})")
+        _insert(conn, staging, df)
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+        conn.execute(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table)}")
+        _create_indexes(conn, table, indexes)
+        _bump_version(conn, table)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def truncate_table(db_path, table, rows):
+    """
+    Deletes the rows of a table past its first `rows` rows (in insertion order), e.g. the
+    rows appended by a build that stopped before saving its checkpoint. The table's counter
+    in VERSIONS_TABLE is bumped in the same transaction when rows are deleted.
+
+    :return: Number of rows deleted (0 when the table does not exist).
+    """
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone()
+        deleted = 0
+        if exists:
+            # write_table only ever inserts, so rowids follow the insertion order
+            deleted = conn.execute(f"DELETE FROM {quote(table)} WHERE rowid NOT IN "
+                                   f"(SELECT rowid FROM {quote(table)} ORDER BY rowid LIMIT ?)",
+                                   (rows,)).rowcount
+            if deleted:
+                _bump_version(conn, table)
+        conn.execute("COMMIT")
+        return deleted
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _create_indexes(conn, table, indexes):
+    for col in indexes:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(table + '_' + col + '_idx')} "
+                     f"ON {quote(table)} ({quote(col)})")
+
+
+def _bump_version(conn, table):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} "
+                 "(name TEXT PRIMARY KEY, version INTEGER NOT NULL, written_at TEXT NOT NULL)")
+    conn.execute(f"INSERT INTO {VERSIONS_TABLE} VALUES (?, 1, ?) "
+                 "ON CONFLICT(name) DO UPDATE SET version = version + 1, written_at = excluded.written_at",
+                 (table, datetime.datetime.now().isoformat(timespec="seconds")))
+
@@ -0,0 +1,26 @@
+# Source files and table names of each tour. The WTA tables keep the '(w)' names
+# used since the database was first built from the WTA files.
+TOURS = {
+    "atp": {
+        "csv_folder": "./data/CSV/ATP/",
+        "players_csv": "data/CSV/ATP/atp_players.csv",
+        "matches_table": "atp_matches",
+        "players_informations": "players_informations",
+        "players_stats": "players_stats",
+    },
+    "wta": {
+        "csv_folder": "./data/CSV/WTA/",
+        "players_csv": "data/CSV/WTA/wta_players.csv",
+        "matches_table": "wta_matches",
+        "players_informations": "players(w)_informations",
+        "players_stats": "players(w)_stats",
+    },
+}
+
+
+def tour_config(tour):
+    """Returns the TOURS entry of a tour ('atp' or 'wta')."""
+    try:
+        return TOURS[tour.lower()]
+    except KeyError:
+        raise ValueError("Unknown tour: " + str(tour)) from None
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import numpy as np
+
+MATRIX_DIR = "data/SQLite/matrices/"
+
+# Bump when the layout of a matrix directory changes (learning/main.py checks it)
+MATRIX_VERSION = 2
+
+ID_COLUMNS = ["WINNER_ID", "LOSER_ID"]
+
+
+def export_training_matrix(final_data, dates, out_dir, append=False):
+    """
+    Writes a matches table as a compact training matrix that jobs can memory-map instead of
+    reading the table through SQLite and pandas. The directory holds:
+      - features.npy: the feature columns as a C-ordered float32 matrix (missing values are NaN),
+      - ids.npy: WINNER_ID and LOSER_ID as an int32 matrix,
+      - dates.npy: the tourney date of each match (YYYYMMDD) as int32, e.g. to split by season,
+      - manifest.json: the number of rows, the file layouts and the feature column names.
+    Both .npy files open zero-copy with np.load(..., mmap_mode="r").
+
+    The files are written to a temporary directory which then replaces out_dir, so a job
+    mapping the matrix never sees a half-written one.
+
+    :param final_data: Matches table (WINNER_ID, LOSER_ID, then the features).
+    :param dates: Tourney date of each row of final_data.
+    :param append: Add the rows after those of the existing matrix in out_dir (when the table was appended to).
+    """
+    feature_columns = [col for col in final_data.columns if col not in ID_COLUMNS]
+    features = final_data[feature_columns].to_numpy(dtype=np.float32, na_value=np.nan)
+    ids = final_data[ID_COLUMNS].to_numpy(dtype=np.int32)
+    dates = np.asarray(dates, dtype=np.int32)
+    if append:
+        old_features, old_ids, old_dates, manifest = open_training_matrix(out_dir)
+        if manifest["feature_columns"] != feature_columns:
+            raise ValueError(f"Cannot append to {out_dir}: the feature columns differ")
+        features = np.concatenate([old_features, features])
+        ids = np.concatenate([old_ids, ids])
+        dates = np.concatenate([old_dates, dates])
+        del old_features, old_ids, old_dates
+
+    _write_matrix(features, ids, dates, feature_columns, out_dir)
+
+
+def truncate_training_matrix(out_dir, rows):
+    """
+    Keeps the first `rows` rows of the matrix in out_dir, e.g. to drop the rows appended
+    by a build that stopped before saving its checkpoint. Does nothing when the matrix
+    has no more rows than that.
+
+    :return: Number of rows dropped.
+    """
+    old_features, old_ids, old_dates, manifest = open_training_matrix(out_dir)
+    dropped = max(manifest["rows"] - rows, 0)
+    if dropped:
+        features = np.array(old_features[:rows])
+        ids = np.array(old_ids[:rows])
+        dates = np.array(old_dates[:rows])
+        del old_features, old_ids, old_dates
+        _write_matrix(features, ids, dates, manifest["feature_columns"], out_dir)
+    return dropped
+
+
+def _write_matrix(features, ids, dates, feature_columns, out_dir):
+    """
+    Writes the matrix files to a temporary directory which then replaces out_dir.
+    """
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "features.npy"), np.ascontiguousarray(features))
+    np.save(os.path.join(tmp_dir, "ids.npy"), np.ascontiguousarray(ids))
+    np.save(os.path.join(tmp_dir, "dates.npy"), dates)
+    manifest = {
+        "matrix_version": MATRIX_VERSION,
+        "rows": len(features),
+        "features": {"file": "features.npy", "dtype": "float32"},
+        "ids": {"file": "ids.npy", "dtype": "int32", "columns": ID_COLUMNS},
+        "dates": {"file": "dates.npy", "dtype": "int32"},
+        "feature_columns": feature_columns,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = out_dir.rstrip("/") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def open_training_matrix(matrix_dir):
+    """
+    Maps a matrix written by export_training_matrix.
+
+    :return: Tuple (features, ids, dates, manifest), the arrays being read-only memory maps.
+    """
+    with open(os.path.join(matrix_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("matrix_version") != MATRIX_VERSION:
+        raise ValueError(f"{matrix_dir} was written with an incompatible matrix version")
+    features = np.load(os.path.join(matrix_dir, manifest["features"]["file"]), mmap_mode="r")
+    ids = np.load(os.path.join(matrix_dir, manifest["ids"]["file"]), mmap_mode="r")
+    dates = np.load(os.path.join(matrix_dir, manifest["dates"]["file"]), mmap_mode="r")
+    return features, ids, dates, manifest
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+CHARTING_URL = "https://www.tennisabstract.com/charting/"
+CACHE_DIR = "data/Scrapping/.cache/"
+
+# Statuses worth retrying: rate limiting and server-side errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CachedFetcher:
+    """
+    Fetches many pages concurrently, keeping every response in an on-disk cache.
+
+    Requests are issued from asyncio with at most `concurrency` in flight, each one running
+    in a worker thread over a shared requests.Session whose connection pool keeps that many
+    keep-alive connections open. A cached page is revalidated with a conditional request
+    (If-None-Match / If-Modified-Since), so an unchanged page costs a 304 and no download.
+    Request errors (connection errors, timeouts, truncated or undecodable bodies) and
+    RETRY_STATUSES are retried with exponential backoff. A failure only affects its own URL:
+    fetch_all always returns a result for every URL.
+
+    The cache holds two files per URL, named after its SHA-1: the body ('.html') and the
+    response metadata ('.json': url, ETag, Last-Modified, fetch time).
+    """
+    def __init__(self, cache_dir=CACHE_DIR, concurrency=8, retries=3, backoff=0.5, timeout=30):
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # One thread per connection (asyncio's default executor is sized on the CPU count)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+    def _paths(self, url):
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + ".html"), os.path.join(self.cache_dir, name + ".json")
+
+    def cached(self, url):
+        """Cached body of a URL, or None (also when the cache entry is unreadable)."""
+        body_path, meta_path = self._paths(url)
+        if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(body_path, encoding="utf-8") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _cached_meta(self, url):
+        """Cached metadata of a URL, or None when it is missing or corrupt (the page is then fetched again)."""
+        body_path, meta_path = self._paths(url)
+        if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if isinstance(meta, dict) else None
+
+    def _store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        # Body first, then metadata: an entry only counts as cached once both exist
+        for path, content in ((body_path, response.text), (meta_path, json.dumps(meta))):
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
+    def _request(self, url):
+        meta = self._cached_meta(url)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            text = self.cached(url)
+            if text is not None:
+                return {"url": url, "status": 304, "changed": False, "text": text}
+            # The cached body could not be read back: download the page again
+            response = self.session.get(url, timeout=self.timeout)
+        if response.status_code in RETRY_STATUSES:
+            response.raise_for_status()
+        if response.status_code == 200:
+            if "charset" not in response.headers.get("Content-Type", ""):
+                response.encoding = "utf-8"
+            self._store(url, response)
+        return {"url": url, "status": response.status_code, "changed": response.status_code == 200,
+                "text": response.text if response.status_code == 200 else None}
+
+    async def fetch(self, url, semaphore):
+        """
+        Fetches one URL through the cache.
+
+        :return: Dict with url, status, changed (False when the cached copy was still valid)
+                 and text (None for error statuses). After the last retry, the error is
+                 returned as status None and an error message.
+        """
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self.executor, self._request, url)
+                except requests.RequestException as e:
+                    if attempt == self.retries:
+                        return self._failed(url, e)
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def _failed(self, url, error):
+        return {"url": url, "status": None, "changed": False, "text": self.cached(url), "error": str(error)}
+
+    async def fetch_all(self, urls):
+        """
+        Fetches the URLs concurrently. Any other error of a URL (e.g. writing its cache entry)
+        is returned as its failed result, so one URL never discards the results of the others.
+        """
+        urls = list(urls)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self.fetch(url, semaphore) for url in urls), return_exceptions=True)
+        return [self._failed(url, result) if isinstance(result, Exception) else result
+                for url, result in zip(urls, results)]
+
+
+def fetch_pages(urls, **kwargs):
+    """
+    Fetches a list of URLs concurrently through a CachedFetcher (keyword arguments are passed
+    to it) and returns their results in the same order.
+    """
+    fetcher = CachedFetcher(**kwargs)
+    try:
+        return asyncio.run(fetcher.fetch_all(urls))
+    finally:
+        fetcher.close()
+
+
+def fetch_match_pages(csv_file="data/Scrapping/list_matches.csv", base_url=CHARTING_URL, **kwargs):
+    """
+    Fetches the charting page of every match of the list written by list.py.
+    Point base_url to a local server to run against saved pages.
+    """
+    urls = [base_url + href for href in pd.read_csv(csv_file)["URL"]]
+    return fetch_pages(urls, **kwargs)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    results = fetch_match_pages()
+    changed = sum(result["changed"] for result in results)
+    failed = [result for result in results if result["status"] not in (200, 304)]
+    print(f"{len(results)} pages in {time.perf_counter() - start:.1f}s: {changed} downloaded, "
+          f"{len(results) - changed - len(failed)} unchanged, {len(failed)} failed")
+    for result in failed:
+        print(result["url"], result.get("error") or result["status"])
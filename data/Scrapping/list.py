@@ -1,12 +1,34 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import html
+import os
 import re
+import sqlite3
+import sys
+import time
+import pandas as pd
+from fetcher import CHARTING_URL, fetch_pages
+
+CSV_FILE = "data/Scrapping/list_matches.csv"
+DB_TABLE = "charted_matches"
+
+# URLs of the links that could not be parsed, kept next to the list (one URL per line, or a
+# table named after the list table) so they are reported once and skipped on later runs
+SKIPPED_SUFFIX = ".skipped"
+
+COLUMNS = ["date", "tournament", "round", "player1_firstname", "player1_lastname",
+           "player2_firstname", "player2_lastname", "category", "URL"]
+
+MATCH_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2}) (.+?) ([A-Z0-9]+): ([\w\s\.-]+) vs ([\w\s\.-]+) \((ATP|WTA)\)$")
+
+# Start of the div listing the matches, the div tags inside it, and its links
+HEADER_PATTERN = re.compile(r"""<div\b[^>]*\bid\s*=\s*["']?header\b[^>]*>""", re.I)
+DIV_TAG_PATTERN = re.compile(r"<(/?)div\b", re.I)
+LINK_PATTERN = re.compile(r"""<a\b[^>]*?\bhref\s*=\s*["']([^"']*)["'][^>]*>(.*?)</a\s*>""", re.I | re.S)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
 
 def parse_match_info(match_str):
-    pattern = r"^(\d{4}-\d{2}-\d{2}) (.+?) ([A-Z0-9]+): ([\w\s\.-]+) vs ([\w\s\.-]+) \((ATP|WTA)\)$"
-    match = re.match(pattern, match_str)
-    
+    match = MATCH_PATTERN.match(match_str)
+
     if match:
         date = match.group(1)
         tournament = match.group(2).strip()
@@ -36,28 +58,153 @@ def parse_match_info(match_str):
     else:
         return None
 
-url = "https://www.tennisabstract.com/charting/"
 
-response = requests.get(url)
-soup = BeautifulSoup(response.text, "html.parser")
+def header_html(page):
+    """The content of the page's header div (nested divs included), or '' if it has none."""
+    start = HEADER_PATTERN.search(page)
+    if start is None:
+        return ""
+    depth = 1
+    for tag in DIV_TAG_PATTERN.finditer(page, start.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return page[start.end():tag.start()]
+    return page[start.end():]
+
 
-matches_div = soup.find('div', id='header')
-links = matches_div.find_all('a')
+def new_matches(page, seen, since=None, skipped=None):
+    """
+    Yields the matches of the charting page that are not in seen, in page order.
 
-data = []
-for link in links:
-    href = link.get('href')
-    if href.startswith('2025'):
-        text = link.get_text()
+    Only the header div is scanned, with precompiled patterns instead of a full HTML parse,
+    and only the links whose URL is new are parsed: a run costs a scan of the links plus
+    work proportional to the number of new matches.
+
+    :param seen: Set of the URLs already listed (or skipped), extended with the URLs yielded
+                 and the URLs of the links that could not be parsed.
+    :param since: Earliest match date to keep ('YYYY-MM-DD'), None for all.
+    :param skipped: List extended with the URLs of the links that could not be parsed.
+    """
+    for link in LINK_PATTERN.finditer(header_html(page)):
+        href = html.unescape(link.group(1))
+        if href in seen or not href[:1].isdigit():
+            continue
+        text = html.unescape(TAG_PATTERN.sub("", link.group(2))).strip()
+        # The text starts with the match date
+        if since is not None and text[:10] < since:
+            continue
         parsed = parse_match_info(text)
-        if parsed:
-            parsed["URL"] = href
-            data.append(parsed)
-        else:
+        seen.add(href)
+        if parsed is None:
             print(f"Could not parse: {text}")
-    else:
-        continue
+            if skipped is not None:
+                skipped.append(href)
+            continue
+        parsed["URL"] = href
+        yield parsed
+
+
+def listed_in_csv(csv_file=CSV_FILE):
+    """
+    :return: Tuple (seen, first_date): the URLs listed in csv_file or skipped by earlier runs,
+             and the date of its oldest match (None for an empty list).
+    """
+    seen = set()
+    first_date = None
+    if os.path.exists(csv_file):
+        listed = pd.read_csv(csv_file, usecols=["date", "URL"], dtype=str)
+        seen.update(listed["URL"])
+        if len(listed):
+            first_date = listed["date"].min()
+    if os.path.exists(csv_file + SKIPPED_SUFFIX):
+        with open(csv_file + SKIPPED_SUFFIX, encoding="utf-8") as f:
+            seen.update(line.strip() for line in f if line.strip())
+    return seen, first_date
+
+
+def record_skipped_in_csv(urls, csv_file=CSV_FILE):
+    if urls:
+        with open(csv_file + SKIPPED_SUFFIX, "a", encoding="utf-8") as f:
+            f.writelines(url + "\n" for url in urls)
+
+
+def append_to_csv(rows, csv_file=CSV_FILE):
+    """Appends rows to the list (created with its header if missing). :return: Number of rows."""
+    if not rows:
+        return 0
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(csv_file, mode="a", header=not os.path.exists(csv_file),
+                                               index=False)
+    return len(rows)
+
+
+def connect_list_table(db_path, table=DB_TABLE):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    columns = ", ".join(f'"{column}" TEXT' for column in COLUMNS[:-1])
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns}, "URL" TEXT PRIMARY KEY)')
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}{SKIPPED_SUFFIX}" ("URL" TEXT PRIMARY KEY)')
+    return conn
+
+
+def listed_in_db(conn, table=DB_TABLE):
+    """Same as listed_in_csv for the list table of connect_list_table."""
+    seen = {row[0] for row in conn.execute(f'SELECT URL FROM "{table}"')}
+    seen.update(row[0] for row in conn.execute(f'SELECT URL FROM "{table}{SKIPPED_SUFFIX}"'))
+    first_date = conn.execute(f'SELECT MIN(date) FROM "{table}"').fetchone()[0]
+    return seen, first_date
+
+
+def record_skipped_in_db(urls, conn, table=DB_TABLE):
+    with conn:
+        conn.executemany(f'INSERT OR IGNORE INTO "{table}{SKIPPED_SUFFIX}" (URL) VALUES (?)',
+                         [(url,) for url in urls])
+
+
+def upsert_into_db(rows, conn, table=DB_TABLE):
+    """Inserts rows into the list table, updating the ones whose URL is already there. :return: Number of rows."""
+    placeholders = ", ".join("?" * len(COLUMNS))
+    updates = ", ".join(f'"{column}" = excluded."{column}"' for column in COLUMNS[:-1])
+    with conn:
+        conn.executemany(f'INSERT INTO "{table}" ({", ".join(COLUMNS)}) VALUES ({placeholders}) '
+                         f'ON CONFLICT(URL) DO UPDATE SET {updates}',
+                         [tuple(row[column] for column in COLUMNS) for row in rows])
+    return len(rows)
+
+
+def update_list(url=CHARTING_URL, csv_file=CSV_FILE, db_path=None, since=None):
+    """
+    Adds the matches charted since the last run to the list: appended to csv_file, or
+    upserted into the DB_TABLE table of db_path when given. The list itself is the index
+    of the matches already seen, so nothing already listed is parsed or written again. The
+    links that cannot be parsed are recorded next to the list and skipped on later runs.
+
+    :param since: Earliest match date to list ('YYYY-MM-DD'). By default, the date of the oldest
+                  listed match, so matches charted late (e.g. December matches charted after New
+                  Year) are still added; for an empty list, the first day of the current year
+                  (it would otherwise start with the whole history).
+    :return: Number of matches added.
+    """
+    result = fetch_pages([url])[0]
+    if result["text"] is None:
+        raise RuntimeError(f"Could not fetch {url}: {result.get('error') or result['status']}")
+
+    conn = None if db_path is None else connect_list_table(db_path)
+    try:
+        seen, first_date = listed_in_csv(csv_file) if conn is None else listed_in_db(conn)
+        if since is None:
+            since = first_date or time.strftime("%Y-01-01")
+        skipped = []
+        rows = list(new_matches(result["text"], seen, since, skipped))
+        if conn is None:
+            record_skipped_in_csv(skipped, csv_file)
+            return append_to_csv(rows, csv_file)
+        record_skipped_in_db(skipped, conn)
+        return upsert_into_db(rows, conn)
+    finally:
+        if conn is not None:
+            conn.close()
 
-df = pd.DataFrame(data)
 
-df.to_csv("data/Scrapping/list_matches.csv", index=False)
+if __name__ == "__main__":
+    added = update_list(since=sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"{added} new matches")
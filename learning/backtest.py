@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import accuracy_score, brier_score_loss, log_loss
+from main import MATRIX_DIR, XGB_PARAMS, load_training_matrix, orient_matches
+
+
+def booster_params(params=XGB_PARAMS):
+    """
+    Converts XGBClassifier settings (as in main.XGB_PARAMS) to xgb.train parameters.
+
+    :return: Tuple (params, num_boost_round).
+    """
+    params = dict(params)
+    num_boost_round = params.pop("n_estimators", 100)
+    if "learning_rate" in params:
+        params["eta"] = params.pop("learning_rate")
+    params.setdefault("objective", "binary:logistic")
+    params.setdefault("tree_method", "hist")
+    return params, num_boost_round
+
+
+def walk_forward_folds(dates, first_test_year=None, min_train_years=3):
+    """
+    Time-ordered folds: each season is tested on a model trained on every earlier season.
+
+    :param dates: Tourney date (YYYYMMDD) of each match.
+    :param first_test_year: First season to test (by default the first one with min_train_years before it).
+    :return: List of the test seasons.
+    """
+    years = np.unique(np.asarray(dates) // 10000)
+    if first_test_year is None:
+        first_test_year = years[0] + min_train_years
+    return [int(year) for year in years if year >= first_test_year]
+
+
+def fold_matrices(X, y, train, test, max_bin=256):
+    """
+    Quantizes a fold once: the training rows go to a QuantileDMatrix (XGBoost's hist
+    sketch, one byte per value with the default max_bin) and the test rows reuse its cuts.
+    """
+    dtrain = xgb.QuantileDMatrix(X[train], y[train], max_bin=max_bin)
+    dtest = xgb.QuantileDMatrix(X[test], y[test], ref=dtrain)
+    return dtrain, dtest
+
+
+def fold_metrics(y_true, proba):
+    return {
+        "accuracy": accuracy_score(y_true, proba >= 0.5),
+        "log_loss": log_loss(y_true, proba, labels=[0, 1]),
+        "brier": brier_score_loss(y_true, proba),
+    }
+
+
+def _run_fold(data_dir, test_year, params, nthread):
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+    years = np.load(os.path.join(data_dir, "years.npy"), mmap_mode="r")
+    train = years < test_year
+    test = years == test_year
+    dtrain, dtest = fold_matrices(X, y, train, test)
+    params, num_boost_round = booster_params(params)
+    params["nthread"] = nthread
+    booster = xgb.train(params, dtrain, num_boost_round)
+    proba = booster.predict(dtest)
+    return {"test_year": test_year, "n_train": int(train.sum()), "n_test": int(test.sum()),
+            **fold_metrics(y[test], proba)}
+
+
+def run_backtest(matrix_dir=MATRIX_DIR, params=XGB_PARAMS, first_test_year=None, min_train_years=3,
+                 workers=None, seed=0):
+    """
+    Walk-forward backtest over every season of the training matrix exported by
+    data/SQLite/matches_data.py.
+
+    The matches are oriented once (orient_matches, with the given seed) and written to a
+    temporary directory that every worker process memory-maps, so the folds share one copy
+    of the data. The folds run in parallel, splitting the CPUs between them.
+
+    :return: DataFrame with one row per test season: the number of training and test
+             matches, the accuracy, the log-loss and the Brier score.
+    :raises ValueError: When the matrix has no season to test (too few seasons, or
+                        first_test_year after the last one).
+    """
+    values, dates, feature_columns = load_training_matrix(matrix_dir)
+    X, y, _ = orient_matches(values, feature_columns, seed=seed)
+    folds = walk_forward_folds(dates, first_test_year, min_train_years)
+    if not folds:
+        raise ValueError(f"No season to test in {matrix_dir} with first_test_year={first_test_year} "
+                         f"and min_train_years={min_train_years}")
+    workers = min(workers or os.cpu_count() or 1, len(folds))
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+
+    data_dir = tempfile.mkdtemp(prefix="backtest-")
+    try:
+        np.save(os.path.join(data_dir, "X.npy"), X)
+        np.save(os.path.join(data_dir, "y.npy"), y)
+        np.save(os.path.join(data_dir, "years.npy"), np.asarray(dates) // 10000)
+        del X, y
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_fold, [data_dir] * len(folds), folds,
+                                    [params] * len(folds), [nthread] * len(folds)))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    results = run_backtest()
+    print(results.to_string(index=False))
+    weights = results["n_test"]
+    for metric in ("accuracy", "log_loss", "brier"):
+        print(f"{metric}: {np.average(results[metric], weights=weights):.4f}")
@@ -1,73 +1,136 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
 import sqlite3
 from xgboost import XGBClassifier
 from sklearn.metrics import accuracy_score
-
-conn = sqlite3.connect("data/SQLite/tennis.db")
-final_data = pd.read_sql_query("SELECT * from wta_matches", conn)
-conn.close()
-final_data = final_data.reset_index(drop=True)
-
-final_data["RESULT"] = 1
-column_to_randomize = []
-
-for val in list(final_data.columns):
-    if "DIFF" in val:
-        column_to_randomize.append(val)
-
-column_to_randomize.append("RESULT")
-column_to_randomize.append("WINNER_ID")
-column_to_randomize.append("LOSER_ID")
-
-final_data[column_to_randomize] = final_data[column_to_randomize].apply(
-    lambda row: row * (-1) if np.random.rand() < 0.5 else row, axis=1
-)
-
-def fix_ids(row):
-    winner, loser = row['WINNER_ID'], row['LOSER_ID']
-    if winner < 0 and loser < 0:
-        winner, loser = abs(loser), abs(winner) 
-    return pd.Series([winner, loser])
-
-final_data[['WINNER_ID', 'LOSER_ID']] = final_data.apply(fix_ids, axis=1)
-final_data.rename(columns={'WINNER_ID': 'PLAYER_1', 'LOSER_ID': 'PLAYER_2'}, inplace=True)
-
-data_np = final_data.to_numpy(dtype=object)[:95375, 2:]
-np.random.shuffle(data_np)
-
-split = 0.85
-total_rows = final_data.shape[0]
-value = round(split * total_rows)
-
-data_np_train = data_np[:value, :]
-data_np_test = data_np[value:, :]
-
-mapper = np.vectorize(lambda x: "Player 2 Wins" if x == -1 else "Player 1 Wins")
-reverse_mapper = np.vectorize(lambda x: 0 if x == "Player 2 Wins" else 1)
-
-x_train = data_np_train[:, :-1]
-x_test = data_np_test[:, :-1]
-y_pred_train = mapper(data_np_train[:, -1:])
-y_pred_test = mapper(data_np_test[:, -1:])
-
-xgb_model = XGBClassifier(n_estimators=200, max_depth=10, learning_rate=0.1, 
-                          subsample=0.8, colsample_bytree=0.7)
-
-xgb_model.fit(data_np_train[:, :-1], reverse_mapper(y_pred_train))
-
-predictions_train = xgb_model.predict(data_np_train[:, :-1])
-predictions_test = xgb_model.predict(data_np_test[:, :-1])
-
-#print("Train Accuracy: ", accuracy_score(reverse_mapper(y_pred_train), predictions_train))
-#print("Test Accuracy: ", accuracy_score(reverse_mapper(y_pred_test), predictions_test))
-
-next_data = pd.read_csv("learning/next.csv")
-
-X_next = next_data.iloc[:, 2:].to_numpy(dtype=object)
-
-predictions_next = xgb_model.predict(X_next)
-
-prediction_labels = np.where(predictions_next == 0, "Player 2 Wins", "Player 1 Wins")
-
-print(prediction_labels)
\ No newline at end of file
+from model_store import save_model
+
+# The profiling stages and the training matrix layout are shared with the data pipeline
+# (data/SQLite/profiling.py and data/SQLite/training_matrix.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data", "SQLite"))
+import profiling
+from training_matrix import open_training_matrix
+
+MATRIX_DIR = "data/SQLite/matrices/wta_matches/"
+
+XGB_PARAMS = dict(n_estimators=200, max_depth=10, learning_rate=0.1,
+                  subsample=0.8, colsample_bytree=0.7)
+
+
+def load_matches_table(db_path="data/SQLite/tennis.db", table="wta_matches"):
+    """
+    Reads the matches table, one row per match seen from the winner's side.
+    """
+    conn = sqlite3.connect(db_path, timeout=60)
+    final_data = pd.read_sql_query(f"SELECT * from {table}", conn)
+    conn.close()
+    return final_data.reset_index(drop=True)
+
+
+def orient_matches(values, feature_columns, mode="random", seed=None):
+    """
+    Turns the matches into the training matrix. Each match is seen from both players'
+    sides by negating the DIFF columns; the label is 1 when PLAYER_1
+    won and 0 when PLAYER_2 won.
+
+    :param values: (matches, features) array of the matches seen from the winner's side,
+                   e.g. the read-only memory map of load_training_matrix (it is not modified).
+    :param mode: "random" keeps one orientation per match, the winner's or the loser's with
+                 even odds. "both" keeps both orientations of every match (twice the rows).
+    :return: Tuple (X, y, groups): X is a C-contiguous float32 matrix of the feature columns,
+             y the int8 labels and groups the row number of each row's match in values (so
+             both orientations of a match can be kept on the same side of a split).
+    """
+    if mode not in ("random", "both"):
+        raise ValueError(f"Unknown augmentation mode: {mode}")
+    # -1 on the DIFF columns, which change sign with the orientation, 1 elsewhere (BEST_OF, DRAW_SIZE)
+    sign = np.where(["DIFF" in col for col in feature_columns], -1, 1).astype(np.float32)
+    n = len(values)
+
+    # X is the only full-size copy of the features
+    if mode == "random":
+        flip = np.random.default_rng(seed).random(n) < 0.5
+        X = np.array(values, dtype=np.float32, order="C")
+        X[flip] *= sign
+        y = (~flip).astype(np.int8)
+        groups = np.arange(n)
+    else:
+        X = np.empty((2 * n, len(feature_columns)), dtype=np.float32)
+        X[:n] = values
+        np.multiply(values, sign, out=X[n:])
+        y = np.concatenate([np.ones(n, dtype=np.int8), np.zeros(n, dtype=np.int8)])
+        groups = np.concatenate([np.arange(n), np.arange(n)])
+    return X, y, groups
+
+
+def prepare_training_data(final_data, mode="random", seed=None):
+    """
+    orient_matches for a matches table read with load_matches_table.
+
+    :return: Tuple (X, y, groups, feature_columns).
+    """
+    feature_columns = list(final_data.columns[2:])
+    values = final_data[feature_columns].to_numpy(dtype=np.float32)
+    return (*orient_matches(values, feature_columns, mode, seed), feature_columns)
+
+
+def load_training_matrix(matrix_dir=MATRIX_DIR):
+    """
+    Maps the training matrix exported by data/SQLite/matches_data.py (see
+    data/SQLite/training_matrix.py) without reading it into memory.
+
+    :return: Tuple (features, dates, feature_columns): features is a read-only float32 memory
+             map and dates the tourney date (YYYYMMDD) of each match.
+    """
+    features, _, dates, manifest = open_training_matrix(matrix_dir)
+    return features, dates, manifest["feature_columns"]
+
+
+def train_model(X, y, groups, split=0.85, seed=None):
+    """
+    Fits the classifier on a random split of the matches (all the rows of a match fall on
+    the same side of the split).
+
+    :return: Tuple (model, train_accuracy, test_accuracy).
+    """
+    matches = np.unique(groups)
+    np.random.default_rng(seed).shuffle(matches)
+    train_matches = matches[:round(split * len(matches))]
+    train = np.isin(groups, train_matches)
+
+    xgb_model = XGBClassifier(**XGB_PARAMS)
+
+    with profiling.stage("fit", train.sum()):
+        xgb_model.fit(X[train], y[train])
+
+    with profiling.stage("predict", len(X)):
+        predictions_train = xgb_model.predict(X[train])
+        predictions_test = xgb_model.predict(X[~train])
+
+    return (xgb_model,
+            accuracy_score(y[train], predictions_train),
+            accuracy_score(y[~train], predictions_test))
+
+
+if __name__ == "__main__":
+    with profiling.session("train"):
+        with profiling.stage("load") as stage:
+            if os.path.exists(os.path.join(MATRIX_DIR, "manifest.json")):
+                values, _, feature_columns = load_training_matrix()
+                X, y, groups = orient_matches(values, feature_columns)
+            else:
+                final_data = load_matches_table()
+                X, y, groups, feature_columns = prepare_training_data(final_data)
+            stage.rows = len(X)
+        xgb_model, train_accuracy, test_accuracy = train_model(X, y, groups)
+
+        #print("Train Accuracy: ", train_accuracy)
+        #print("Test Accuracy: ", test_accuracy)
+
+        with profiling.stage("save"):
+            version_dir = save_model(xgb_model, feature_columns, params=XGB_PARAMS,
+                                     metrics={"train_accuracy": train_accuracy, "test_accuracy": test_accuracy},
+                                     n_matches=len(np.unique(groups)))
+    print("Model saved to", version_dir)
@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import time
+import xgboost
+from xgboost import XGBClassifier
+
+MODEL_DIR = "learning/models/"
+
+# Bump when the layout of a model version directory changes
+ARTIFACT_VERSION = 1
+
+# Temporary version directories older than this are left over from a crashed save
+STALE_TMP_SECONDS = 3600
+
+
+def save_model(model, feature_columns, model_dir=MODEL_DIR, **info):
+    """
+    Saves a trained classifier (or Booster) as a new model version:
+    '<model_dir>/<version>/model.json' (XGBoost's own format) next to 'manifest.json', which
+    lists the feature columns in the order the model expects them. Versions are named after
+    the training time (to the microsecond), so they sort chronologically. The version is written
+    to '<version>.tmp' and renamed once complete; '.tmp' directories left over by crashed saves
+    are removed.
+
+    :param info: Extra JSON-serializable entries for the manifest (params, metrics, ...).
+    :return: Path of the version directory.
+    """
+    now = time.time()
+    version = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now % 1 * 1e6):06d}"
+    version_dir = os.path.join(model_dir, version)
+    tmp_dir = version_dir + ".tmp"
+    _remove_stale_tmp_dirs(model_dir, now)
+    os.makedirs(tmp_dir, exist_ok=True)
+    model.save_model(os.path.join(tmp_dir, "model.json"))
+    manifest = {
+        "artifact_version": ARTIFACT_VERSION,
+        "version": version,
+        "xgboost_version": xgboost.__version__,
+        "feature_columns": list(feature_columns),
+        **info,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    # The version only becomes visible to load_model once it is complete
+    os.replace(tmp_dir, version_dir)
+    return version_dir
+
+
+def _remove_stale_tmp_dirs(model_dir, now):
+    """Removes the '.tmp' version directories of saves that did not finish (not those of running saves)."""
+    if not os.path.isdir(model_dir):
+        return
+    for name in os.listdir(model_dir):
+        path = os.path.join(model_dir, name)
+        try:
+            if name.endswith(".tmp") and now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def list_versions(model_dir=MODEL_DIR):
+    """Saved model versions, oldest first (versions still being written are left out)."""
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(name for name in os.listdir(model_dir)
+                  if not name.endswith(".tmp")
+                  and os.path.isfile(os.path.join(model_dir, name, "manifest.json")))
+
+
+def load_model(model_dir=MODEL_DIR, version=None):
+    """
+    Loads a saved model version (the latest one by default).
+
+    :return: Tuple (model, manifest).
+    """
+    if version is None:
+        versions = list_versions(model_dir)
+        if not versions:
+            raise FileNotFoundError(f"No saved model in {model_dir}, run learning/main.py first")
+        version = versions[-1]
+    version_dir = os.path.join(model_dir, version)
+    with open(os.path.join(version_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("artifact_version") != ARTIFACT_VERSION:
+        raise ValueError(f"Model {version} was saved with an incompatible artifact version")
+    model = XGBClassifier()
+    model.load_model(os.path.join(version_dir, "model.json"))
+    return model, manifest
@@ -1,109 +1,194 @@
 import sqlite3
-import csv
-from collections import defaultdict
-from tqdm import tqdm
+import os
+import sys
+import numpy as np
 import pandas as pd
 
-def add_matches(player1_id, player2_id, atp_point_diff, atp_rank_diff, best_of, draw_size, age_diff, height_diff, h2h_diff, h2h_surface_diff):
-    conn = sqlite3.connect("data/SQLite/tennis.db")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM 'players(w)_stats' WHERE player_id IN (?, ?)", (player1_id, player2_id))
-    rows = cursor.fetchall()
-    if len(rows) != 2:
-        print("Données insuffisantes pour les deux joueurs")
-        conn.close()
-        return
-    
-    player1, player2 = None, None
-    for row in rows:
-        if row["player_id"] == player1_id:
-            player1 = row
-        elif row["player_id"] == player2_id:
-            player2 = row
-            
-    if player1 is None or player2 is None:
-        print("Erreur lors de l'identification des joueurs")
-        conn.close()
-        return
-
-    row_data = {}
-
-    row_data["PLAYER_1"] = player1_id
-    row_data["PLAYER_2"] = player2_id
-    row_data["ATP_POINT_DIFF"] = atp_point_diff
-    row_data["ATP_RANK_DIFF"] = atp_rank_diff
-    row_data["BEST_OF"] = best_of
-    row_data["DRAW_SIZE"] = draw_size
-    row_data["H2H_DIFF"] = h2h_diff
-    row_data["H2H_SURFACE_DIFF"] = h2h_surface_diff
-    row_data["AGE_DIFF"] = age_diff
-    row_data["HEIGHT_DIFF"] = height_diff
-
-    row_data["DIFF_N_GAMES"] = player1["n_games"] - player2["n_games"]
-    
-    for p in [3, 5, 10, 25, 50, 100]:
-        col = f"win_last_{p}"
-        header_key = f"WIN_LAST_{p}_DIFF"
-        if col in player1.keys() and col in player2.keys():
-            row_data[header_key] = player1[col] - player2[col]
-        else:
-            row_data[header_key] = ""
-    
-    performance_metrics = {
-        "P_ACE": "p_ace",
-        "P_DF": "p_df",
-        "P_1ST_IN": "p_1stIn",
-        "P_1ST_WON": "p_1stWon",
-        "P_2ND_WON": "p_2ndWon",
-        "P_BP_SAVED": "p_bpSaved"
-    }
-
-    performance_periods = [3, 5, 10, 20, 50, 100, 200, 300, 2000]
-    for period in performance_periods:
-        for header_metric, db_metric in performance_metrics.items():
-            db_col = f"{db_metric}_last_{period}"
-            header_key = f"{header_metric}_LAST_{period}_DIFF"
-            if db_col in player1.keys() and db_col in player2.keys():
-                row_data[header_key] = player1[db_col] - player2[db_col]
-            else:
-                row_data[header_key] = ""
-    
-
-    row_data["ELO_DIFF"] = (player1["final_elo"] - player2["final_elo"]) if "final_elo" in player1.keys() and "final_elo" in player2.keys() else ""
-
-    row_data["ELO_SURFACE_DIFF"] = (player1["elo_hard"] - player2["elo_hard"]) if "elo_hard" in player1.keys() and "elo_hard" in player2.keys() else ""
-    
-    for p in [5, 10, 20, 35, 50, 100, 250]:
-        col_name = f"elo_grad_last_{p}"
-        header_name = f"ELO_GRAD_{p}_DIFF"
-        if col_name in player1.keys() and col_name in player2.keys():
-            row_data[header_name] = player1[col_name] - player2[col_name]
+# The profiling stages are shared with the data pipeline (data/SQLite/profiling.py), and
+# player_cache.py reads the table versions kept by data/SQLite/storage.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data", "SQLite"))
+import profiling
+from player_cache import PlayerVectorCache
+
+DB_PATH = "data/SQLite/tennis.db"
+STATS_TABLE = "players(w)_stats"
+NEXT_CSV = "learning/next.csv"
+
+# Match context given with each fixture, copied as is into the feature row
+CONTEXT_COLUMNS = ["ATP_POINT_DIFF", "ATP_RANK_DIFF", "AGE_DIFF", "HEIGHT_DIFF", "BEST_OF", "DRAW_SIZE",
+                   "H2H_DIFF", "H2H_SURFACE_DIFF"]
+
+PERFORMANCE_METRICS = {
+    "P_ACE": "p_ace",
+    "P_DF": "p_df",
+    "P_1ST_IN": "p_1stIn",
+    "P_1ST_WON": "p_1stWon",
+    "P_2ND_WON": "p_2ndWon",
+    "P_BP_SAVED": "p_bpSaved"
+}
+
+# (feature column, players stats column) pairs: the feature is the player 1 stat minus the player 2 stat
+STAT_DIFFS = [("DIFF_N_GAMES", "n_games")]
+STAT_DIFFS += [(f"WIN_LAST_{p}_DIFF", f"win_last_{p}") for p in [3, 5, 10, 25, 50, 100]]
+for period in [3, 5, 10, 20, 50, 100, 200, 300, 2000]:
+    STAT_DIFFS += [(f"{header_metric}_LAST_{period}_DIFF", f"{db_metric}_last_{period}")
+                   for header_metric, db_metric in PERFORMANCE_METRICS.items()]
+STAT_DIFFS += [("ELO_DIFF", "final_elo"), ("ELO_SURFACE_DIFF", "elo_hard")]
+STAT_DIFFS += [(f"ELO_GRAD_{p}_DIFF", f"elo_grad_last_{p}") for p in [5, 10, 20, 35, 50, 100, 250]]
+
+STAT_COLUMNS = [col for _, col in STAT_DIFFS]
+
+HEADER = ["PLAYER_1", "PLAYER_2"] + CONTEXT_COLUMNS + [header for header, _ in STAT_DIFFS]
+
+_caches = {}
+
+
+def fetch_player_stats(conn, player_ids, table=STATS_TABLE):
+    """
+    Reads the players stats rows of all the given players with a single query.
+
+    :return: DataFrame indexed by player_id (players without stats are missing).
+    """
+    player_ids = [int(pid) for pid in dict.fromkeys(player_ids)]
+    if not player_ids:
+        return pd.DataFrame(index=pd.Index([], name="player_id"))
+    placeholders = ", ".join("?" * len(player_ids))
+    query = f"SELECT * FROM '{table}' WHERE player_id IN ({placeholders})"
+    return pd.read_sql_query(query, conn, params=player_ids).set_index("player_id")
+
+
+def _pair_rows(fixtures, diffs):
+    rows = fixtures.reindex(columns=["PLAYER_1", "PLAYER_2"] + CONTEXT_COLUMNS).reset_index(drop=True)
+    features = pd.DataFrame(diffs, columns=[header for header, _ in STAT_DIFFS])
+    return pd.concat([rows, features], axis=1)
+
+
+def feature_rows(fixtures, stats):
+    """
+    Computes the feature rows of the fixtures from players stats already in memory.
+
+    :param fixtures: DataFrame with one fixture per row: PLAYER_1, PLAYER_2 and the CONTEXT_COLUMNS.
+    :param stats: Players stats rows indexed by player_id, as returned by fetch_player_stats.
+    :return: Tuple (rows, known): the HEADER columns for every fixture, and a boolean array
+             telling which fixtures have stats for both players (the others have empty features).
+    """
+    pos1 = stats.index.get_indexer(fixtures["PLAYER_1"].to_numpy(dtype="int64"))
+    pos2 = stats.index.get_indexer(fixtures["PLAYER_2"].to_numpy(dtype="int64"))
+    known = (pos1 >= 0) & (pos2 >= 0)
+
+    diffs = np.full((len(fixtures), len(STAT_DIFFS)), np.nan)
+    # Take the players' rows before the columns, so only those rows are copied. Stats
+    # missing from the table give empty features, as in the CSV written so far
+    values = (stats.iloc[np.concatenate([pos1[known], pos2[known]])]
+              .reindex(columns=STAT_COLUMNS).to_numpy(dtype="float64"))
+    diffs[known] = values[:known.sum()] - values[known.sum():]
+    return _pair_rows(fixtures, diffs), known
+
+
+def cached_feature_rows(fixtures, cache):
+    """
+    Same as feature_rows, with the players stats read through a PlayerVectorCache: the pair
+    features are a subtraction of the cached vectors, and only players missing from the
+    cache are read from SQLite.
+    """
+    n = len(fixtures)
+    vectors, found = cache.lookup(np.concatenate([fixtures["PLAYER_1"].to_numpy(dtype="int64"),
+                                                  fixtures["PLAYER_2"].to_numpy(dtype="int64")]))
+    known = found[:n] & found[n:]
+    diffs = vectors[:n] - vectors[n:]
+    diffs[~known] = np.nan
+    return _pair_rows(fixtures, diffs), known
+
+
+def history_feature_rows(fixtures, history, date_column="DATE", match_column=None):
+    """
+    Same as feature_rows, with the players stats as of each fixture's date, read from a
+    PlayerHistory (data/SQLite/player_history.py) instead of the latest players stats: past
+    fixtures get the features they had on the day, without any of the later matches.
+
+    A date leaves out the earlier rounds of the fixture's own tournament. To backfill the
+    matches of the matches table with the stats they were trained on, pass match_column
+    instead: the stats are then those before the match of that row of the table.
+
+    :param date_column: Column of the fixture dates (YYYYMMDD integers, strings or datetimes).
+    :param match_column: Column of the fixtures' rows in the matches table (0 for the first row).
+    """
+    n = len(fixtures)
+    player_ids = np.concatenate([fixtures["PLAYER_1"].to_numpy(dtype="int64"),
+                                 fixtures["PLAYER_2"].to_numpy(dtype="int64")])
+    if match_column is not None:
+        matches = fixtures[match_column].to_numpy(dtype="int64")
+        vectors, found = history.lookup(player_ids, before=np.concatenate([matches, matches]),
+                                        columns=STAT_COLUMNS)
+    else:
+        dates = fixtures[date_column].to_numpy()
+        vectors, found = history.lookup(player_ids, np.concatenate([dates, dates]), columns=STAT_COLUMNS)
+    known = found[:n] & found[n:]
+    diffs = vectors[:n] - vectors[n:]
+    diffs[~known] = np.nan
+    return _pair_rows(fixtures, diffs), known
+
+
+def player_cache(db_path=DB_PATH, table=STATS_TABLE, maxsize=4096):
+    """
+    The process-wide PlayerVectorCache of a players stats table, created on first use.
+    """
+    key = (db_path, table)
+    if key not in _caches:
+        _caches[key] = PlayerVectorCache(STAT_COLUMNS, db_path, table, maxsize)
+    return _caches[key]
+
+
+def build_feature_rows(fixtures, conn=None, db_path=DB_PATH, csv_path=None, table=STATS_TABLE, cache=None):
+    """
+    Builds the feature rows of a whole slate of fixtures at once.
+
+    :param fixtures: DataFrame with one fixture per row: PLAYER_1, PLAYER_2 and the CONTEXT_COLUMNS.
+    :param conn: Open connection to reuse between slates; one is opened on db_path (and closed) when omitted.
+    :param csv_path: When given, the rows are appended to this CSV (with the header if it is empty).
+    :param cache: PlayerVectorCache to read the players stats through instead of querying the table.
+    :return: DataFrame with the HEADER columns, one row per fixture whose two players have stats.
+    """
+    with profiling.stage("feature_rows", len(fixtures)):
+        if cache is not None:
+            rows, known = cached_feature_rows(fixtures, cache)
         else:
-            row_data[header_name] = ""
-    
-    header = [
-        "PLAYER_1", "PLAYER_2", "ATP_POINT_DIFF", "ATP_RANK_DIFF", "AGE_DIFF", "HEIGHT_DIFF", "BEST_OF", "DRAW_SIZE", 
-        "H2H_DIFF", "H2H_SURFACE_DIFF", "DIFF_N_GAMES",
-        "WIN_LAST_3_DIFF", "WIN_LAST_5_DIFF", "WIN_LAST_10_DIFF", "WIN_LAST_25_DIFF", "WIN_LAST_50_DIFF", "WIN_LAST_100_DIFF",
-        "P_ACE_LAST_3_DIFF", "P_DF_LAST_3_DIFF", "P_1ST_IN_LAST_3_DIFF", "P_1ST_WON_LAST_3_DIFF", "P_2ND_WON_LAST_3_DIFF", "P_BP_SAVED_LAST_3_DIFF",
-        "P_ACE_LAST_5_DIFF", "P_DF_LAST_5_DIFF", "P_1ST_IN_LAST_5_DIFF", "P_1ST_WON_LAST_5_DIFF", "P_2ND_WON_LAST_5_DIFF", "P_BP_SAVED_LAST_5_DIFF",
-        "P_ACE_LAST_10_DIFF", "P_DF_LAST_10_DIFF", "P_1ST_IN_LAST_10_DIFF", "P_1ST_WON_LAST_10_DIFF", "P_2ND_WON_LAST_10_DIFF", "P_BP_SAVED_LAST_10_DIFF",
-        "P_ACE_LAST_20_DIFF", "P_DF_LAST_20_DIFF", "P_1ST_IN_LAST_20_DIFF", "P_1ST_WON_LAST_20_DIFF", "P_2ND_WON_LAST_20_DIFF", "P_BP_SAVED_LAST_20_DIFF",
-        "P_ACE_LAST_50_DIFF", "P_DF_LAST_50_DIFF", "P_1ST_IN_LAST_50_DIFF", "P_1ST_WON_LAST_50_DIFF", "P_2ND_WON_LAST_50_DIFF", "P_BP_SAVED_LAST_50_DIFF",
-        "P_ACE_LAST_100_DIFF", "P_DF_LAST_100_DIFF", "P_1ST_IN_LAST_100_DIFF", "P_1ST_WON_LAST_100_DIFF", "P_2ND_WON_LAST_100_DIFF", "P_BP_SAVED_LAST_100_DIFF",
-        "P_ACE_LAST_200_DIFF", "P_DF_LAST_200_DIFF", "P_1ST_IN_LAST_200_DIFF", "P_1ST_WON_LAST_200_DIFF", "P_2ND_WON_LAST_200_DIFF", "P_BP_SAVED_LAST_200_DIFF",
-        "P_ACE_LAST_300_DIFF", "P_DF_LAST_300_DIFF", "P_1ST_IN_LAST_300_DIFF", "P_1ST_WON_LAST_300_DIFF", "P_2ND_WON_LAST_300_DIFF", "P_BP_SAVED_LAST_300_DIFF",
-        "P_ACE_LAST_2000_DIFF", "P_DF_LAST_2000_DIFF", "P_1ST_IN_LAST_2000_DIFF", "P_1ST_WON_LAST_2000_DIFF", "P_2ND_WON_LAST_2000_DIFF", "P_BP_SAVED_LAST_2000_DIFF",
-        "ELO_DIFF", "ELO_SURFACE_DIFF", "ELO_GRAD_5_DIFF", "ELO_GRAD_10_DIFF", "ELO_GRAD_20_DIFF", "ELO_GRAD_35_DIFF", "ELO_GRAD_50_DIFF", "ELO_GRAD_100_DIFF", "ELO_GRAD_250_DIFF"
-    ]
-    
-    with open("learning/next.csv", "a", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=header)
-        csvfile.seek(0, 2)
-        if csvfile.tell() == 0:
-            writer.writeheader()
-        writer.writerow(row_data)
-    
-    conn.close()
+            own_conn = conn is None
+            if own_conn:
+                conn = sqlite3.connect(db_path, timeout=60)
+            try:
+                player_ids = np.concatenate([fixtures["PLAYER_1"].to_numpy(), fixtures["PLAYER_2"].to_numpy()])
+                stats = fetch_player_stats(conn, player_ids, table)
+            finally:
+                if own_conn:
+                    conn.close()
+            rows, known = feature_rows(fixtures, stats)
+
+    for a, b in fixtures.loc[~known, ["PLAYER_1", "PLAYER_2"]].itertuples(index=False):
+        print(f"Données insuffisantes pour les deux joueurs ({a}, {b})")
+    rows = rows[known].reset_index(drop=True)
+
+    if csv_path is not None:
+        write_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        rows.to_csv(csv_path, mode="a", header=write_header, index=False, lineterminator="\r\n")
+    return rows
+
+
+def add_matches(player1_id, player2_id, atp_point_diff, atp_rank_diff, best_of, draw_size, age_diff, height_diff, h2h_diff, h2h_surface_diff):
+    """
+    Appends the feature row of one fixture to learning/next.csv. Use build_feature_rows
+    to build a whole slate at once. The players stats are read through the shared player_cache.
+    """
+    fixture = pd.DataFrame([{
+        "PLAYER_1": player1_id,
+        "PLAYER_2": player2_id,
+        "ATP_POINT_DIFF": atp_point_diff,
+        "ATP_RANK_DIFF": atp_rank_diff,
+        "AGE_DIFF": age_diff,
+        "HEIGHT_DIFF": height_diff,
+        "BEST_OF": best_of,
+        "DRAW_SIZE": draw_size,
+        "H2H_DIFF": h2h_diff,
+        "H2H_SURFACE_DIFF": h2h_surface_diff,
+    }])
+    build_feature_rows(fixture, csv_path=NEXT_CSV, cache=player_cache())
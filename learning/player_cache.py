@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+# Table in which data/SQLite/storage.py::write_table counts the rewrites of each table
+# (data/SQLite is put on the path by next.py)
+from storage import VERSIONS_TABLE
+
+
+class PlayerVectorCache:
+    """
+    Bounded LRU cache of the players stats rows as float vectors, one row of a contiguous
+    (maxsize, n_columns) array per cached player.
+
+    The cache is tied to one version of the stats table. Before each lookup it asks SQLite
+    whether the database changed since the last lookup (PRAGMA data_version, which does not
+    read the database); when it did and the table's counter in VERSIONS_TABLE moved, every
+    entry is dropped. Databases written before the counter existed are invalidated on any change.
+    Players missing from the table are cached too, as missing.
+    """
+    def __init__(self, columns, db_path, table, maxsize=4096):
+        """
+        :param columns: Stats columns to keep, in order (columns absent from the table are NaN).
+        """
+        self.columns = list(columns)
+        self.table = table
+        self.maxsize = maxsize
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.vectors = np.full((maxsize, len(self.columns)), np.nan)
+        self.slots = OrderedDict()
+        self.free = list(range(maxsize - 1, -1, -1))
+        self.data_version = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def close(self):
+        self.conn.close()
+
+    def clear(self):
+        self.slots.clear()
+        self.free = list(range(self.maxsize - 1, -1, -1))
+
+    def _check_version(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        try:
+            row = self.conn.execute(f"SELECT version FROM {VERSIONS_TABLE} WHERE name = ?",
+                                    (self.table,)).fetchone()
+            version = None if row is None else row[0]
+        except sqlite3.OperationalError:
+            version = None
+        if version is None or version != self.version:
+            self.clear()
+        self.version = version
+
+    def _fetch(self, player_ids):
+        table_columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info('{self.table}')")]
+        present = [col for col in self.columns if col in table_columns]
+        positions = [self.columns.index(col) for col in present]
+        placeholders = ", ".join("?" * len(player_ids))
+        select = ", ".join(["player_id"] + [f'"{col}"' for col in present])
+        rows = self.conn.execute(f"SELECT {select} FROM '{self.table}' WHERE player_id IN ({placeholders})",
+                                 player_ids).fetchall()
+        found = {}
+        for row in rows:
+            vector = np.full(len(self.columns), np.nan)
+            vector[positions] = np.array(row[1:], dtype="float64")
+            found[row[0]] = vector
+        return found
+
+    def _store(self, pid, vector):
+        if pid in self.slots:
+            return
+        # Missing players hold no slot, so there is a free slot whenever the cache is not full
+        while len(self.slots) >= self.maxsize:
+            _, slot = self.slots.popitem(last=False)
+            if slot is not None:
+                self.free.append(slot)
+        slot = None
+        if vector is not None:
+            slot = self.free.pop()
+            self.vectors[slot] = vector
+        self.slots[pid] = slot
+
+    def lookup(self, player_ids):
+        """
+        Stats vectors of the given players, fetching the missing ones with a single query.
+
+        :return: Tuple (vectors, found): a (len(player_ids), n_columns) array and a boolean
+                 array telling which players have a stats row (the others have NaN vectors).
+        """
+        player_ids = [int(pid) for pid in player_ids]
+        with self.lock:
+            self._check_version()
+            missing = [pid for pid in dict.fromkeys(player_ids) if pid not in self.slots]
+            self.misses += len(missing)
+            self.hits += len(player_ids) - len(missing)
+            if missing:
+                fetched = {}
+                # Stay under SQLite's limit on bound parameters
+                for start in range(0, len(missing), 900):
+                    fetched.update(self._fetch(missing[start:start + 900]))
+                for pid in missing:
+                    self._store(pid, fetched.get(pid))
+            result = np.full((len(player_ids), len(self.columns)), np.nan)
+            found = np.zeros(len(player_ids), dtype=bool)
+            for i, pid in enumerate(player_ids):
+                # A slate larger than the cache can evict its own players: refetch those
+                if pid not in self.slots:
+                    self._store(pid, self._fetch([pid]).get(pid))
+                slot = self.slots[pid]
+                self.slots.move_to_end(pid)
+                if slot is not None:
+                    result[i] = self.vectors[slot]
+                    found[i] = True
+            return result, found
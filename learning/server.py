@@ -0,0 +1,230 @@
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from model_store import MODEL_DIR, load_model
+from next import CONTEXT_COLUMNS, DB_PATH, STATS_TABLE, cached_feature_rows, player_cache
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+def _number(value):
+    """Float value of a JSON number (or numeric string); booleans and other types raise ValueError."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{value!r} is not a number")
+    return float(value)
+
+
+def parse_fixture(fixture):
+    """
+    Checks a fixture of a request and coerces its values: PLAYER_1 and PLAYER_2 to integer ids,
+    the context columns to floats (null meaning an unknown value).
+
+    :raises ValueError: When a player id or a context value is not a number.
+    """
+    if not isinstance(fixture, dict) or "PLAYER_1" not in fixture or "PLAYER_2" not in fixture:
+        raise ValueError("each fixture needs PLAYER_1 and PLAYER_2")
+    parsed = dict(fixture)
+    for key in ("PLAYER_1", "PLAYER_2"):
+        try:
+            player_id = _number(fixture[key])
+        except ValueError:
+            raise ValueError(f"{key} must be a player id, got {fixture[key]!r}") from None
+        if not player_id.is_integer() or abs(player_id) >= 2**63:
+            raise ValueError(f"{key} must be a player id, got {fixture[key]!r}")
+        parsed[key] = int(player_id)
+    for key in CONTEXT_COLUMNS:
+        if fixture.get(key) is None:
+            parsed[key] = np.nan
+            continue
+        try:
+            parsed[key] = _number(fixture[key])
+        except ValueError:
+            raise ValueError(f"{key} must be a number or null, got {fixture[key]!r}") from None
+    return parsed
+
+
+class Scorer:
+    """
+    Model loaded once, scoring fixtures with the players stats read through a
+    PlayerVectorCache, so a rebuilt players stats table is picked up without a restart.
+    """
+    def __init__(self, model_dir=MODEL_DIR, version=None, db_path=DB_PATH, table=STATS_TABLE,
+                 cache_size=16384):
+        self.model, self.manifest = load_model(model_dir, version)
+        self.feature_columns = self.manifest["feature_columns"]
+        self.cache = player_cache(db_path, table, cache_size)
+
+    def score(self, fixtures):
+        """
+        Scores a DataFrame of fixtures (PLAYER_1, PLAYER_2 and the match context columns;
+        missing context columns are treated as unknown values by the model).
+
+        :return: List with one dict per fixture: the players, the probability that PLAYER_1
+                 wins and the predicted label, or an error for fixtures with an unknown player.
+        """
+        rows, known = cached_feature_rows(fixtures, self.cache)
+        proba = np.full(len(rows), np.nan)
+        if known.any():
+            X = rows.loc[known, self.feature_columns].to_numpy(dtype="float32")
+            proba[known] = self.model.predict_proba(X)[:, 1]
+        results = []
+        for p1, p2, ok, p in zip(rows["PLAYER_1"], rows["PLAYER_2"], known, proba):
+            result = {"PLAYER_1": int(p1), "PLAYER_2": int(p2)}
+            if ok:
+                result["P_PLAYER_1_WINS"] = float(p)
+                result["PREDICTION"] = "Player 1 Wins" if p >= 0.5 else "Player 2 Wins"
+            else:
+                result["ERROR"] = "Données insuffisantes pour les deux joueurs"
+            results.append(result)
+        return results
+
+
+class MicroBatcher:
+    """
+    Groups the fixtures of concurrent requests into one model call. The first waiting
+    request starts a batch, which is scored once it holds max_batch fixtures or max_wait
+    seconds have passed, whichever comes first. When a batch fails, its requests are scored
+    one by one, so only the request at fault gets the error.
+    """
+    def __init__(self, scorer, max_batch=256, max_wait=0.005):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, fixtures):
+        """Queues a list of fixture dicts; the Future resolves to their list of results."""
+        future = Future()
+        self.requests.put((fixtures, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _score(self, batch):
+        fixtures = pd.DataFrame([fixture for items, _ in batch for fixture in items])
+        results = self.scorer.score(fixtures) if len(fixtures) else []
+        start = 0
+        for items, future in batch:
+            future.set_result(results[start:start + len(items)])
+            start += len(items)
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._score(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                for item in batch:
+                    try:
+                        self._score([item])
+                    except Exception as e:
+                        item[1].set_exception(e)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    # Accept bursts of concurrent clients (the socketserver default backlog is 5)
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_handler(batcher):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        """
+        POST /predict with a JSON fixture or list of fixtures, e.g.
+        {"PLAYER_1": 216347, "PLAYER_2": 211148, "BEST_OF": 3, "DRAW_SIZE": 128, ...}
+        GET /health returns the model version and the player cache counters.
+        """
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error": "not found"})
+            cache = batcher.scorer.cache
+            self._reply(200, {"version": batcher.scorer.manifest["version"], "cached_players": len(cache),
+                              "stats_version": cache.version, "cache_hits": cache.hits,
+                              "cache_misses": cache.misses})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                return self._reply(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                fixtures = [parse_fixture(f) for f in (body if isinstance(body, list) else [body])]
+            except ValueError as e:
+                return self._reply(400, {"error": str(e)})
+            try:
+                results = batcher.submit(fixtures).result()
+            except Exception as e:
+                return self._reply(500, {"error": str(e)})
+            self._reply(200, results if isinstance(body, list) else results[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(host=HOST, port=PORT, model_dir=MODEL_DIR, version=None, db_path=DB_PATH,
+          max_batch=256, max_wait=0.005):
+    """
+    Loads the model once, then answers scoring requests until interrupted.
+    """
+    scorer = Scorer(model_dir, version, db_path)
+    batcher = MicroBatcher(scorer, max_batch, max_wait)
+    server = ScoringServer((host, port), make_handler(batcher))
+    print(f"Model {scorer.manifest['version']} serving on http://{host}:{port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def score_csv(csv_path="learning/next.csv", model_dir=MODEL_DIR, version=None):
+    """
+    Predicts the fixtures of a feature CSV written by next.py with a saved model.
+    """
+    model, manifest = load_model(model_dir, version)
+    next_data = pd.read_csv(csv_path)
+    predictions_next = model.predict(next_data[manifest["feature_columns"]].to_numpy(dtype="float32"))
+    return np.where(predictions_next == 0, "Player 2 Wins", "Player 1 Wins")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--score"]:
+        print(score_csv(*sys.argv[2:3]))
+    else:
+        serve()
@@ -0,0 +1,208 @@
+import re
+import sqlite3
+import sys
+import unicodedata
+import numpy as np
+import pandas as pd
+from model_store import MODEL_DIR, load_model
+from next import CONTEXT_COLUMNS, DB_PATH, cached_feature_rows, player_cache, profiling
+# data/SQLite is put on the path by next.py
+from tours import tour_config
+
+SCRAPED_LIST = "data/Scrapping/list_matches.csv"
+
+_NOT_ALNUM = re.compile(r"[^a-z0-9]+").sub
+
+
+def normalize_name(name):
+    """
+    Lower-case ASCII form of a name: accents removed, hyphens, dots and apostrophes turned
+    into spaces, spaces collapsed ("Félix Auger-Aliassime" gives "felix auger aliassime").
+    """
+    if not isinstance(name, str):
+        return ""
+    if not name.isascii():
+        name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NOT_ALNUM(" ", name.lower()).split())
+
+
+class NameIndex:
+    """
+    In-memory index of a players informations table by normalized full name.
+
+    The full name is matched rather than the first and last names separately, since the
+    scraped list splits names on the last space ("Felix Auger" "Aliassime") while the
+    table does not ("Felix" "Auger Aliassime").
+    """
+    def __init__(self, players, with_stats=None):
+        """
+        :param players: Iterable of (player_id, name_first, name_last) tuples.
+        :param with_stats: Ids of the players having a stats row, used to break ties between namesakes.
+        """
+        self.ids = {}
+        for pid, first, last in players:
+            self.ids.setdefault(normalize_name(f"{first} {last}"), []).append(pid)
+        self.with_stats = set(with_stats) if with_stats is not None else None
+
+    def resolve(self, keys):
+        """
+        Resolves normalized full names.
+
+        :return: Tuple (ids, problems): ids is a float array (NaN where unresolved) and problems
+                 maps each unresolved or tie-broken name to a description.
+        """
+        ids = np.full(len(keys), np.nan)
+        problems = {}
+        for i, key in enumerate(keys):
+            candidates = self.ids.get(key, [])
+            if len(candidates) > 1 and self.with_stats is not None:
+                active = [pid for pid in candidates if pid in self.with_stats]
+                if len(active) == 1:
+                    problems[key] = f"{len(candidates)} players named so, kept the only one with stats ({active[0]})"
+                    candidates = active
+            if len(candidates) == 1:
+                ids[i] = candidates[0]
+            elif not candidates:
+                problems[key] = "no player with this name"
+            else:
+                problems[key] = f"ambiguous: {len(candidates)} players ({', '.join(map(str, candidates))})"
+        return ids, problems
+
+
+def load_name_index(conn, tour):
+    config = tour_config(tour)
+    players = conn.execute(f"SELECT player_id, name_first, name_last FROM '{config['players_informations']}'")
+    with_stats = [row[0] for row in conn.execute(f"SELECT player_id FROM '{config['players_stats']}'")]
+    return NameIndex(players, with_stats)
+
+
+def head_to_head(conn, tour, p1, p2):
+    """Wins of each PLAYER_1 against PLAYER_2 minus the reverse, from the tour's matches table."""
+    ids = sorted({int(pid) for pid in p1} | {int(pid) for pid in p2})
+    placeholders = ", ".join("?" * len(ids))
+    counts = pd.read_sql_query(
+        f"SELECT WINNER_ID, LOSER_ID, COUNT(*) AS n FROM {tour_config(tour)['matches_table']} "
+        f"WHERE WINNER_ID IN ({placeholders}) AND LOSER_ID IN ({placeholders}) GROUP BY WINNER_ID, LOSER_ID",
+        conn, params=ids + ids)
+    wins = {(int(w), int(l)): n for w, l, n in counts.itertuples(index=False)}
+    return np.array([wins.get((int(a), int(b)), 0) - wins.get((int(b), int(a)), 0) for a, b in zip(p1, p2)],
+                    dtype="float64")
+
+
+def player_details(conn, tour, player_ids):
+    """Date of birth and height of the given players, indexed by player_id."""
+    ids = sorted({int(pid) for pid in player_ids})
+    placeholders = ", ".join("?" * len(ids))
+    table = tour_config(tour)["players_informations"]
+    details = pd.read_sql_query(f"SELECT player_id, dob, height FROM '{table}' WHERE player_id IN ({placeholders})",
+                                conn, params=ids)
+    details["dob"] = pd.to_datetime(details["dob"], errors="coerce")
+    details["height"] = details["height"].astype("float64")
+    return details.set_index("player_id")
+
+
+def slate_fixtures(slate, index, conn, tour):
+    """
+    Resolves the players of a scraped slate of one tour and fills the match context known
+    from the database: age and height differences from the informations table and the H2H
+    difference from the matches table. Ranking points, format, draw size and the surface are
+    not in the scraped list and are left missing.
+
+    :return: Tuple (fixtures, resolved, problems).
+    """
+    key1 = [normalize_name(f"{first} {last}") for first, last in
+            zip(slate["player1_firstname"], slate["player1_lastname"])]
+    key2 = [normalize_name(f"{first} {last}") for first, last in
+            zip(slate["player2_firstname"], slate["player2_lastname"])]
+    id1, problems = index.resolve(key1)
+    id2, problems2 = index.resolve(key2)
+    problems.update(problems2)
+    resolved = ~np.isnan(id1) & ~np.isnan(id2)
+
+    fixtures = pd.DataFrame(np.nan, index=range(resolved.sum()), columns=["PLAYER_1", "PLAYER_2"] + CONTEXT_COLUMNS)
+    p1 = id1[resolved].astype("int64")
+    p2 = id2[resolved].astype("int64")
+    fixtures["PLAYER_1"] = p1
+    fixtures["PLAYER_2"] = p2
+    if len(fixtures):
+        details = player_details(conn, tour, np.concatenate([p1, p2]))
+        dates = pd.to_datetime(slate.loc[resolved, "date"]).to_numpy()
+        age1 = (dates - details["dob"].reindex(p1).to_numpy()) / np.timedelta64(1, "D") / 365.25
+        age2 = (dates - details["dob"].reindex(p2).to_numpy()) / np.timedelta64(1, "D") / 365.25
+        fixtures["AGE_DIFF"] = age1 - age2
+        fixtures["HEIGHT_DIFF"] = details["height"].reindex(p1).to_numpy() - details["height"].reindex(p2).to_numpy()
+        fixtures["H2H_DIFF"] = head_to_head(conn, tour, p1, p2)
+    return fixtures, resolved, problems
+
+
+class SlateScorer:
+    """
+    Scores scraped slates (the columns of data/Scrapping/list_matches.csv), ATP and WTA
+    matches alike. The model and the name index of each tour are loaded once, so a process
+    scoring several slates keeps one SlateScorer; the players stats go through the player
+    vector cache of each tour.
+    """
+    def __init__(self, db_path=DB_PATH, model_dir=MODEL_DIR, version=None):
+        self.db_path = db_path
+        self.model, self.manifest = load_model(model_dir, version)
+        self.indexes = {}
+
+    def score(self, slate):
+        """
+        Resolves the names of the slate, builds the feature rows of each tour in bulk and
+        scores every fixture in one model call.
+
+        :return: Tuple (scored, problems): the slate with PLAYER_1, PLAYER_2, P_PLAYER_1_WINS and
+                 PREDICTION (missing for unresolved fixtures), and the name problems per tour.
+        """
+        slate = slate.reset_index(drop=True)
+        scored = slate.assign(PLAYER_1=pd.NA, PLAYER_2=pd.NA, P_PLAYER_1_WINS=np.nan, PREDICTION=None)
+        all_rows = []
+        positions = []
+        problems = {}
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            for tour, tour_slate in slate.groupby("category"):
+                try:
+                    stats_table = tour_config(tour)["players_stats"]
+                except ValueError:
+                    problems[tour] = {"": "unknown category"}
+                    continue
+                with profiling.stage("resolve", len(tour_slate)):
+                    if tour not in self.indexes:
+                        self.indexes[tour] = load_name_index(conn, tour)
+                    fixtures, resolved, problems[tour] = slate_fixtures(tour_slate, self.indexes[tour], conn, tour)
+                with profiling.stage("feature_rows", len(fixtures)):
+                    rows, known = cached_feature_rows(fixtures, player_cache(self.db_path, stats_table))
+                rows_index = tour_slate.index[resolved]
+                scored.loc[rows_index, "PLAYER_1"] = fixtures["PLAYER_1"].to_numpy()
+                scored.loc[rows_index, "PLAYER_2"] = fixtures["PLAYER_2"].to_numpy()
+                all_rows.append(rows[known])
+                positions.append(rows_index[known])
+        finally:
+            conn.close()
+
+        rows = pd.concat(all_rows, ignore_index=True) if all_rows else pd.DataFrame()
+        if len(rows):
+            with profiling.stage("predict", len(rows)):
+                X = rows[self.manifest["feature_columns"]].to_numpy(dtype="float32")
+                proba = self.model.predict_proba(X)[:, 1]
+            index = np.concatenate(positions)
+            scored.loc[index, "P_PLAYER_1_WINS"] = proba
+            scored.loc[index, "PREDICTION"] = np.where(proba >= 0.5, "Player 1 Wins", "Player 2 Wins")
+        return scored, problems
+
+
+def score_slate(slate, db_path=DB_PATH, model_dir=MODEL_DIR, version=None):
+    """One-off SlateScorer(db_path, model_dir, version).score(slate)."""
+    return SlateScorer(db_path, model_dir, version).score(slate)
+
+
+if __name__ == "__main__":
+    with profiling.session("score_slate"):
+        scored, problems = score_slate(pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else SCRAPED_LIST))
+    for tour, tour_problems in problems.items():
+        for name, problem in tour_problems.items():
+            print(f"{tour} {name}: {problem}")
+    print(scored[["date", "tournament", "round", "player1_lastname", "player2_lastname", "category",
+                  "P_PLAYER_1_WINS", "PREDICTION"]].to_string(index=False))
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import xgboost as xgb
+from backtest import booster_params, fold_matrices, fold_metrics
+from main import MATRIX_DIR, XGB_PARAMS, load_training_matrix, orient_matches
+
+TUNING_DIR = "learning/tuning/"
+
+# Values sampled for each trial (the learning rate is sampled log-uniformly between its bounds)
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 5, 6, 8, 10],
+    "learning_rate": (0.02, 0.3),
+    "subsample": [0.6, 0.7, 0.8, 0.9, 1.0],
+    "colsample_bytree": [0.5, 0.6, 0.7, 0.8, 1.0],
+    "min_child_weight": [1, 2, 5, 10],
+}
+
+# Upper bound on the number of trees, trials stop earlier on the early-stopping season
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 50
+
+_matrices = {}
+
+
+def sample_trials(n_trials, seed=0):
+    """
+    The configurations of a search, trial 0 being the current main.XGB_PARAMS. The same
+    seed always gives the same trials, which is what lets an interrupted search resume.
+    """
+    rng = np.random.default_rng(seed)
+    trials = [dict(XGB_PARAMS)]
+    while len(trials) < n_trials:
+        low, high = SEARCH_SPACE["learning_rate"]
+        trials.append({
+            "max_depth": int(rng.choice(SEARCH_SPACE["max_depth"])),
+            "learning_rate": float(np.exp(rng.uniform(np.log(low), np.log(high)))),
+            "subsample": float(rng.choice(SEARCH_SPACE["subsample"])),
+            "colsample_bytree": float(rng.choice(SEARCH_SPACE["colsample_bytree"])),
+            "min_child_weight": int(rng.choice(SEARCH_SPACE["min_child_weight"])),
+        })
+    return trials[:n_trials]
+
+
+def _init_worker(data_dir, valid_year):
+    # Quantized once per worker process and reused by every trial it runs. Trials train on
+    # the seasons before the last training season, early-stop on that season and are scored
+    # on valid_year, which plays no part in the fit
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+    years = np.load(os.path.join(data_dir, "years.npy"), mmap_mode="r")
+    stop_year = valid_year - 1
+    _matrices["train"], _matrices["stop"] = fold_matrices(X, y, years < stop_year, years == stop_year)
+    _matrices["valid"] = xgb.QuantileDMatrix(X[years == valid_year], y[years == valid_year],
+                                             ref=_matrices["train"])
+    _matrices["y_valid"] = np.asarray(y[years == valid_year])
+
+
+def _run_trial(trial_id, config, nthread):
+    params, _ = booster_params(config)
+    params.update(nthread=nthread, eval_metric="logloss")
+    booster = xgb.train(params, _matrices["train"], MAX_ROUNDS, evals=[(_matrices["stop"], "stop")],
+                        early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+    proba = booster.predict(_matrices["valid"], iteration_range=(0, booster.best_iteration + 1))
+    return {"trial": trial_id, "params": config, "n_estimators": booster.best_iteration + 1,
+            **fold_metrics(_matrices["y_valid"], proba)}
+
+
+def load_results(results_path):
+    """Trials already recorded in a search's results file."""
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _check_results(results, trials, seed, valid_year, results_path):
+    """
+    Refuses to resume a search whose recorded trials were run with another seed, validation
+    season, early-stopping season or configuration, so the results of two different searches
+    never mix in one file.
+    """
+    for result in results:
+        trial = result["trial"]
+        expected = json.loads(json.dumps(trials[trial])) if trial < len(trials) else result["params"]
+        if ((result.get("seed"), result.get("valid_year"), result.get("stop_year"), result["params"])
+                != (seed, valid_year, valid_year - 1, expected)):
+            raise ValueError(f"{results_path} holds trial {trial} of another search (seed "
+                             f"{result.get('seed')}, valid_year {result.get('valid_year')}); pass another "
+                             f"name, or the same seed and valid_year to resume it")
+
+
+def run_search(n_trials=60, name="search", matrix_dir=MATRIX_DIR, valid_year=None, workers=None, seed=0):
+    """
+    Random search of the classifier settings, validated on a held-out season.
+
+    Every trial trains on the seasons before valid_year - 1 (valid_year being the last season
+    by default) and stops adding trees once the log-loss on season valid_year - 1 has not
+    improved for EARLY_STOPPING_ROUNDS rounds; its best number of trees is recorded as
+    n_estimators. The reported metrics are those of valid_year, which is used neither for
+    the fit nor for early stopping. Trials run concurrently on a process pool, and each
+    worker builds the QuantileDMatrix of the three slices once for all of its trials.
+
+    Each finished trial is appended to '<TUNING_DIR>/<name>.jsonl' with the seed and
+    valid_year of the search. Running the same search again (same name, seed and valid_year)
+    skips the trials already recorded, so an interrupted search resumes where it stopped;
+    raising n_trials extends a finished one. Resuming with another seed or valid_year (e.g.
+    the default one after a new season was added) raises ValueError instead.
+
+    :return: The recorded trials, best validation log-loss first.
+    """
+    results_path = os.path.join(TUNING_DIR, name + ".jsonl")
+    values, dates, feature_columns = load_training_matrix(matrix_dir)
+    years = np.asarray(dates) // 10000
+    if valid_year is None:
+        valid_year = int(years.max())
+    if not (years < valid_year - 1).any():
+        raise ValueError(f"Tuning on {valid_year} needs seasons before {valid_year - 1} to train on")
+    trials = sample_trials(n_trials, seed)
+    recorded = load_results(results_path)
+    _check_results(recorded, trials, seed, valid_year, results_path)
+    done = {result["trial"] for result in recorded}
+    pending = [(i, config) for i, config in enumerate(trials) if i not in done]
+
+    if pending:
+        X, y, _ = orient_matches(values, feature_columns, seed=seed)
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        nthread = max(1, (os.cpu_count() or 1) // workers)
+
+        os.makedirs(TUNING_DIR, exist_ok=True)
+        data_dir = tempfile.mkdtemp(prefix="tune-")
+        try:
+            np.save(os.path.join(data_dir, "X.npy"), X)
+            np.save(os.path.join(data_dir, "y.npy"), y)
+            np.save(os.path.join(data_dir, "years.npy"), years)
+            del X, y
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(data_dir, valid_year)) as pool:
+                futures = [pool.submit(_run_trial, i, config, nthread) for i, config in pending]
+                with open(results_path, "a") as f:
+                    for future in as_completed(futures):
+                        result = future.result()
+                        result.update(seed=seed, valid_year=valid_year, stop_year=valid_year - 1)
+                        f.write(json.dumps(result) + "\n")
+                        f.flush()
+                        print(f"trial {result['trial']}: log_loss {result['log_loss']:.4f}, "
+                              f"accuracy {result['accuracy']:.4f}, {result['n_estimators']} trees")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return sorted(load_results(results_path), key=lambda result: result["log_loss"])
+
+
+if __name__ == "__main__":
+    results = run_search()
+    best = results[0]
+    print("Best trial:", best["trial"], dict(best["params"], n_estimators=best["n_estimators"]))
+    print(f"log_loss {best['log_loss']:.4f}, accuracy {best['accuracy']:.4f}, brier {best['brier']:.4f}")
@@ -0,0 +1,75 @@
+import xgboost as xgb
+from backtest import fold_metrics
+from main import MATRIX_DIR, load_training_matrix, orient_matches
+from model_store import MODEL_DIR, load_model, save_model
+
+
+def update_model(method="boost", rounds=20, learning_rate=None, holdout=0.2, matrix_dir=MATRIX_DIR,
+                 model_dir=MODEL_DIR, version=None, seed=None):
+    """
+    Updates a saved model with the matches added to the training matrix since it was trained,
+    instead of refitting it on the whole history (run main.py for a full rebuild).
+
+    The newest holdout share of the new matches is kept aside to compare the saved and the
+    updated model; the update learns from the others. The updated model is saved as a new
+    version whose manifest records that it was trained through the first held-out match, so
+    the held-out matches are part of the next update.
+
+    :param method: "boost" adds rounds trees fitted on the new matches to the model.
+                   "refresh" keeps the trees and recomputes their leaf values and statistics
+                   from the new matches (process_type="update", updater="refresh").
+    :param learning_rate: Learning rate of the added trees ("boost"), the model's one by default.
+    :return: Tuple (version_dir, before, after): the saved version and the metrics of the saved
+             and of the updated model on the held-out matches. None when there is no new match.
+    """
+    if method not in ("boost", "refresh"):
+        raise ValueError(f"Unknown update method: {method}")
+    model, manifest = load_model(model_dir, version)
+    values, _, feature_columns = load_training_matrix(matrix_dir)
+    if feature_columns != manifest["feature_columns"]:
+        raise ValueError("The training matrix has other feature columns than the model, run main.py")
+    trained_through = manifest["n_matches"]
+    if trained_through >= len(values):
+        print("No new match since model", manifest["version"])
+        return None
+
+    X, y, _ = orient_matches(values[trained_through:], feature_columns, seed=seed)
+    split = len(X) - int(round(holdout * len(X)))
+    if split == 0 or split == len(X):
+        raise ValueError(f"Not enough new matches ({len(X)}) to learn from and hold out")
+    dtrain = xgb.DMatrix(X[:split], y[:split])
+    dvalid = xgb.DMatrix(X[split:], y[split:])
+
+    booster = model.get_booster()
+    params = dict(manifest.get("params", {}))
+    params.pop("n_estimators", None)
+    if "learning_rate" in params:
+        params["eta"] = params.pop("learning_rate")
+    params["objective"] = "binary:logistic"
+    if method == "boost":
+        if learning_rate is not None:
+            params["eta"] = learning_rate
+        num_boost_round = rounds
+    else:
+        params.update(process_type="update", updater="refresh", refresh_leaf=True)
+        num_boost_round = booster.num_boosted_rounds()
+
+    before = fold_metrics(y[split:], booster.predict(dvalid))
+    updated = xgb.train(params, dtrain, num_boost_round, xgb_model=booster)
+    after = fold_metrics(y[split:], updated.predict(dvalid))
+
+    version_dir = save_model(updated, feature_columns, model_dir, params=manifest.get("params", {}),
+                             metrics=after, n_matches=trained_through + split,
+                             update={"parent": manifest["version"], "method": method,
+                                     "new_matches": split, "held_out": len(X) - split,
+                                     "metrics_before": before})
+    return version_dir, before, after
+
+
+if __name__ == "__main__":
+    result = update_model()
+    if result is not None:
+        version_dir, before, after = result
+        for metric in ("accuracy", "log_loss", "brier"):
+            print(f"{metric}: {before[metric]:.4f} -> {after[metric]:.4f}")
+        print("Model saved to", version_dir)
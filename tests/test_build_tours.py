@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "data", "SQLite"), os.path.join(ROOT, "benchmarks")]
+
+from build_tours import build_tours
+from synthetic import generate_history
+from tours import TOURS
+
+
+def test_builds_both_tours_concurrently(tmp_path, monkeypatch):
+    # The tour configs and the caches use paths relative to the repo root
+    monkeypatch.chdir(tmp_path)
+    for seed, tour in enumerate(("atp", "wta")):
+        generate_history(os.path.join("data", "CSV", tour.upper()), 3000, 200, start_year=1991,
+                         end_year=2024, tour=tour, seed=seed)
+    os.makedirs(os.path.join("data", "SQLite"))
+    db_path = os.path.join("data", "SQLite", "tennis.db")
+
+    build_tours(db_path=db_path, workers=2)
+
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        for config in TOURS.values():
+            for table in ("players_informations", "matches_table", "players_stats"):
+                count = conn.execute(f"SELECT COUNT(*) FROM '{config[table]}'").fetchone()[0]
+                assert count > 0, config[table]
+    finally:
+        conn.close()
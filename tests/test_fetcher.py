@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "data", "Scrapping"))
+
+from fetcher import fetch_pages
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "charting")
+PAGE = "20250316-M-Indian_Wells_Masters-F-Holger_Rune-Jack_Draper.html"
+ETAG = '"v1"'
+
+
+class ChartingStandIn(BaseHTTPRequestHandler):
+    """
+    Serves the fixture pages with an ETag, answering 304 to a matching If-None-Match.
+    '/flaky/<page>' answers 503 to its first `failures` requests, then serves the page.
+    """
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        path = self.path
+        if path.startswith("/flaky/"):
+            path = path[len("/flaky"):]
+            if type(self).failures > 0:
+                type(self).failures -= 1
+                return self._send(503, b"")
+        file_path = os.path.join(FIXTURES, os.path.basename(path))
+        if not os.path.exists(file_path):
+            return self._send(404, b"")
+        if self.headers.get("If-None-Match") == ETAG:
+            return self._send(304, None)
+        with open(file_path, "rb") as f:
+            self._send(200, f.read())
+
+    def _send(self, status, body):
+        self.send_response(status)
+        if status in (200, 304):
+            self.send_header("ETag", ETAG)
+        if body is not None:
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    ChartingStandIn.failures = 0
+    ChartingStandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChartingStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_downloads_then_revalidates(base_url, tmp_path):
+    url = base_url + PAGE
+    first, = fetch_pages([url], cache_dir=str(tmp_path))
+    assert (first["status"], first["changed"]) == (200, True)
+    assert "Holger Rune vs Jack Draper" in first["text"]
+
+    second, = fetch_pages([url], cache_dir=str(tmp_path))
+    assert (second["status"], second["changed"]) == (304, False)
+    assert second["text"] == first["text"]
+    assert ChartingStandIn.requests[-1] == ("/" + PAGE, ETAG)
+
+
+def test_retries_server_errors(base_url, tmp_path):
+    ChartingStandIn.failures = 2
+    result, = fetch_pages([base_url + "flaky/" + PAGE], cache_dir=str(tmp_path), backoff=0.01)
+    assert result["status"] == 200
+    assert len(ChartingStandIn.requests) == 3
+
+
+def test_failures_stay_per_url(base_url, tmp_path):
+    ChartingStandIn.failures = 10
+    flaky, missing, ok = fetch_pages([base_url + "flaky/" + PAGE, base_url + "missing.html", base_url + PAGE],
+                                     cache_dir=str(tmp_path), retries=1, backoff=0.01)
+    assert flaky["status"] is None and "503" in flaky["error"]
+    assert missing["status"] == 404
+    assert ok["status"] == 200
+
+
+def test_corrupt_metadata_refetches(base_url, tmp_path):
+    url = base_url + PAGE
+    fetch_pages([url], cache_dir=str(tmp_path))
+    for name in os.listdir(tmp_path):
+        if name.endswith(".json"):
+            (tmp_path / name).write_text("{not json")
+    result, = fetch_pages([url], cache_dir=str(tmp_path))
+    assert (result["status"], result["changed"]) == (200, True)
+    assert ChartingStandIn.requests[-1] == ("/" + PAGE, None)
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "data", "SQLite"), os.path.join(ROOT, "benchmarks")]
+
+from feature_engine import FeatureEngine
+from matches_data import REQUIRED_COLUMNS
+from player_history import PlayerHistory, build_player_history
+from synthetic import generate_players, generate_year
+
+
+@pytest.fixture(scope="module")
+def matches():
+    players, skill = generate_players(150, seed=1)
+    rng = np.random.default_rng(1)
+    years = [generate_year(year, 1500, players, skill, rng) for year in (2000, 2001)]
+    return pd.concat(years).dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def history(matches):
+    return build_player_history(matches, progress=False)
+
+
+def replayed_state(matches, stop, player_id):
+    """State of a player after replaying the matches before row `stop`, or None without any."""
+    engine = FeatureEngine()
+    engine.run(matches.iloc[:stop], progress=False)
+    if player_id not in engine.store.index:
+        return None
+    return engine.player_state(engine.store.index[player_id])
+
+
+def test_before_match_is_a_truncated_replay(matches, history):
+    # Rows inside a tournament, so earlier rounds on the same date must be included
+    for k in (0, 1, 200, 1337, len(matches) - 1):
+        for player_id in matches.loc[k, ["winner_id", "loser_id"]]:
+            expected = replayed_state(matches, k, player_id)
+            state = history.as_of(player_id, before=k)
+            values, found = history.lookup([player_id], before=[k])
+            if expected is None:
+                assert state is None and not found[0]
+            else:
+                np.testing.assert_array_equal(state.to_numpy(), expected)
+                np.testing.assert_array_equal(values[0], expected)
+
+
+def test_as_of_date_is_a_replay_of_the_earlier_tournaments(matches, history):
+    dates = matches["tourney_date"].to_numpy()
+    assert (np.diff(dates) >= 0).all()
+    for date in np.unique(dates)[[1, 10, -1]]:
+        stop = np.searchsorted(dates, date, side="left")
+        for player_id in matches.loc[stop, ["winner_id", "loser_id"]]:
+            expected = replayed_state(matches, stop, player_id)
+            state = history.as_of(player_id, date)
+            if expected is None:
+                assert state is None
+            else:
+                np.testing.assert_array_equal(state.to_numpy(), expected)
+
+
+def test_saved_history_answers_the_same(history, tmp_path):
+    history.save(str(tmp_path / "history"))
+    loaded = PlayerHistory.load(str(tmp_path / "history"))
+    player_ids = np.repeat(history.player_ids[:20], 3)
+    before = np.tile([0, 500, 3000], 20)
+    np.testing.assert_array_equal(loaded.lookup(player_ids, before=before)[0],
+                                  history.lookup(player_ids, before=before)[0])